@@ -1,11 +1,15 @@
+import atexit
 import os
 import json
 import logging
 from pathlib import Path
 
 import firebase_admin
-from firebase_admin import credentials
-from google.cloud import firestore
+from firebase_admin import credentials, firestore_async
+from google.cloud.firestore import async_transactional
+
+from memory_store import InMemoryFirestore, PersistentInMemoryFirestore
+from sqlite_store import SQLiteFirestore
 
 
 logger = logging.getLogger(__name__)
@@ -16,88 +20,27 @@ cred_path = os.environ.get(
 )
 
 
-class InMemoryDocument(dict):
-    def __init__(self, store, path):
-        super().__init__()
-        self.store = store
-        self.path = path
-
-    def _ref(self):
-        d = self.store
-        for p in self.path:
-            d = d.setdefault(p, {})
-        return d
-
-    def set(self, data):
-        r = self._ref()
-        r.clear()
-        r.update(data)
-
-    def update(self, data):
-        self._ref().update(data)
-
-    def get(self):
-        data = self._ref()
-
-        class Snap:
-            def __init__(self, d):
-                self._d = dict(d)
-                self.exists = bool(d)
-
-            def to_dict(self):
-                return dict(self._d)
-
-        return Snap(data)
-
-    def delete(self):
-        self._ref().clear()
-
-
-class InMemoryCollection:
-    def __init__(self, store, path):
-        self.store = store
-        self.path = path
-
-    def document(self, doc_id):
-        return InMemoryDocument(self.store, self.path + [doc_id])
-
-    # Simplified query helpers
-    def where(self, *args, **kwargs):
-        return self
-
-    def order_by(self, *args, **kwargs):
-        return self
-
-    def limit(self, *args, **kwargs):
-        return self
-
-    def stream(self):
-        d = InMemoryDocument(self.store, self.path)._ref()
-
-        class Snap:
-            def __init__(self, doc_id, data):
-                self.id = doc_id
-                self._d = dict(data)
-
-            def to_dict(self):
-                return dict(self._d)
-
-        for k, v in d.items():
-            yield Snap(k, v)
-
-
-class InMemoryFirestore:
-    def __init__(self):
-        self.store = {}
+async def run_transaction(client, callback):
+    """Run ``await callback(transaction)`` atomically and return its result.
 
-    def collection(self, name):
-        return InMemoryCollection(self.store, [name])
+    Firestore retries the callback on contention, so it must only read through
+    ``transaction`` and stage its writes on it.
+    """
+    if isinstance(client, (InMemoryFirestore, SQLiteFirestore)):
+        return await client.run_transaction(callback)
+    return await async_transactional(callback)(client.transaction())
 
 
-__all__ = ["db", "InMemoryFirestore"]
+__all__ = ["db", "InMemoryFirestore", "run_transaction"]
 
 
 def initialize_firestore():
+    if os.environ.get("STORAGE_BACKEND", "firestore").lower() == "sqlite":
+        sqlite_path = os.environ.get("SQLITE_PATH", str(Path(__file__).parent / "fleemy.db"))
+        logger.info(f"Using SQLite storage at {sqlite_path}")
+        client = SQLiteFirestore(sqlite_path)
+        atexit.register(client.close)
+        return client
     try:
         if cred_path and Path(cred_path).exists():
             with open(cred_path) as f:
@@ -114,10 +57,20 @@ def initialize_firestore():
             if not firebase_admin._apps:
                 firebase_admin.initialize_app(cred)
             logger.info("Initialized Firestore with provided credentials")
-            return firestore.client()
+            return firestore_async.client()
         raise FileNotFoundError("Credential file not found")
     except Exception as e:
         logger.error(f"Failed to initialize Firestore: {e}")
+        data_dir = os.environ.get("LOCAL_FIRESTORE_DIR")
+        if data_dir:
+            logger.info(f"Using persistent local store in {data_dir}")
+            client = PersistentInMemoryFirestore(
+                data_dir,
+                compact_every=int(os.environ.get("LOCAL_FIRESTORE_COMPACT_EVERY", "10000")),
+                fsync=os.environ.get("LOCAL_FIRESTORE_FSYNC", "false").lower() == "true",
+            )
+            atexit.register(client.close)
+            return client
         return InMemoryFirestore()
 
 
@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+# Result chunks stay well below Firestore's 1 MiB document limit, and one
+# batch deletes at most 500 documents.
+RESULT_CHUNK_BYTES = 512 * 1024
+_DELETE_BATCH = 500
+
+
+class JobError(Exception):
+    """A job could not be submitted (unknown type or invalid parameters)."""
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Firestore returns aware timestamps, the local stores naive UTC ones.
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _JobType:
+    def __init__(self, handler, concurrency: int, max_attempts: int, backoff: float, validate):
+        self.handler = handler
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.validate = validate
+
+
+class JobQueue:
+    """In-process asyncio job runner with job records kept in the database.
+
+    Each job is a document in ``collection`` holding its type, owner,
+    parameters, status (``queued``, ``running``, ``succeeded``, ``failed`` or
+    ``cancelled``), attempt count, result and error. Handlers run as tasks
+    on the event loop, limited per job type by a semaphore. Failed attempts
+    are retried with exponential backoff up to ``max_attempts``.
+
+    A running job holds a lease that its instance renews every third of
+    ``lease`` seconds. Queued jobs and running jobs whose lease has expired,
+    e.g. after a restart or a crashed instance, are picked up again by the
+    periodic recovery scan. Claiming a job is transactional, so one job never
+    runs twice at once.
+
+    Binary results (e.g. export archives) are stored with
+    :meth:`store_result` as chunk documents under the job, so any instance
+    can serve them. The same scan deletes jobs, with their results, once
+    they have been finished for ``retention`` seconds.
+    """
+
+    def __init__(self, client, transact: Callable, collection: str = "jobs", lease: float = 60.0,
+                 retention: float = 86400.0):
+        self.client = client
+        self.transact = transact
+        self.collection = collection
+        self.lease = lease
+        self.retention = retention
+        self.instance = uuid.uuid4().hex
+        self._types: Dict[str, _JobType] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._recovery: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def register(
+        self,
+        job_type: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        *,
+        concurrency: int = 1,
+        max_attempts: int = 3,
+        backoff: float = 2.0,
+        validate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ):
+        """Register ``await handler(job)`` for ``job_type``.
+
+        ``validate(params)`` returns the parameters to store, or raises
+        ``ValueError``. The handler's return value is stored as the result.
+        """
+        self._types[job_type] = _JobType(handler, concurrency, max_attempts, backoff, validate)
+
+    def _ref(self, job_id: str):
+        return self.client.collection(self.collection).document(job_id)
+
+    def _result_chunk(self, job_id: str, index: int):
+        return self._ref(job_id).collection("result_chunks").document(f"{index:06d}")
+
+    async def store_result(self, job_id: str, chunks: AsyncIterable[bytes]) -> Dict[str, int]:
+        """Store a handler's binary output under the job; returns ``{"chunks", "size"}``.
+
+        Chunks left by an earlier attempt are deleted first. Handlers return
+        the counts as part of their result for :meth:`read_result`.
+        """
+        await self._delete_result(job_id)
+        buffer = bytearray()
+        count = size = 0
+
+        async def flush(data: bytes):
+            nonlocal count
+            await self._result_chunk(job_id, count).set({"index": count, "data": data})
+            count += 1
+
+        async for chunk in chunks:
+            buffer += chunk
+            size += len(chunk)
+            while len(buffer) >= RESULT_CHUNK_BYTES:
+                await flush(bytes(buffer[:RESULT_CHUNK_BYTES]))
+                del buffer[:RESULT_CHUNK_BYTES]
+        if buffer or not count:
+            await flush(bytes(buffer))
+        return {"chunks": count, "size": size}
+
+    async def has_result(self, job_id: str, chunks: int) -> bool:
+        """Whether a stored result is complete; purges delete whole results at once."""
+        return chunks > 0 and (await self._result_chunk(job_id, chunks - 1).get()).exists
+
+    async def read_result(self, job_id: str, chunks: int) -> AsyncIterator[bytes]:
+        for index in range(chunks):
+            snap = await self._result_chunk(job_id, index).get()
+            if not snap.exists:
+                raise JobError(f"Result of job {job_id} is no longer available")
+            yield snap.to_dict()["data"]
+
+    async def _delete_result(self, job_id: str):
+        refs = [snap.reference async for snap in self._ref(job_id).collection("result_chunks").stream()]
+        for i in range(0, len(refs), _DELETE_BATCH):
+            batch = self.client.batch()
+            for ref in refs[i:i + _DELETE_BATCH]:
+                batch.delete(ref)
+            await batch.commit()
+
+    async def submit(self, job_type: str, params: Dict[str, Any], owner: str) -> Dict[str, Any]:
+        spec = self._types.get(job_type)
+        if spec is None:
+            raise JobError(f"Unknown job type: {job_type}")
+        if spec.validate:
+            try:
+                params = spec.validate(params)
+            except ValueError as e:
+                raise JobError(str(e)) from e
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "owner": owner,
+            "params": params,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": spec.max_attempts,
+            "result": None,
+            "error": None,
+            "run_after": now,
+            "lease_until": None,
+            "instance": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        await self._ref(job["id"]).set(job)
+        self._schedule(job["id"], now)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        snap = await self._ref(job_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        ref = self._ref(job_id)
+
+        async def mark(transaction):
+            snap = await ref.get(transaction=transaction)
+            if not snap.exists:
+                return None
+            job = dict(snap.to_dict())
+            if job["status"] in FINAL_STATUSES:
+                return job
+            now = _now()
+            update = {"status": "cancelled", "lease_until": None, "updated_at": now, "finished_at": now}
+            transaction.update(ref, update)
+            job.update(update)
+            return job
+
+        job = await self.transact(self.client, mark)
+        # A job running on another instance stops at its next heartbeat.
+        task = self._tasks.get(job_id)
+        if task:
+            task.cancel()
+        return job
+
+    def _schedule(self, job_id: str, run_after: datetime):
+        if job_id in self._tasks or self._stopping:
+            return
+        task = asyncio.create_task(self._run(job_id, run_after))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str, run_after: Optional[datetime]):
+        while run_after is not None:
+            delay = (_as_utc(run_after) - _now()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                run_after = await self._attempt(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Job {job_id} could not be run")
+                return
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ref = self._ref(job_id)
+
+        async def claim(transaction):
+            snap = await ref.get(transaction=transaction)
+            if not snap.exists:
+                return None
+            job = dict(snap.to_dict())
+            now = _now()
+            lease_until = _as_utc(job.get("lease_until"))
+            expired = job["status"] == "running" and (lease_until is None or lease_until <= now)
+            if job["status"] != "queued" and not expired:
+                return None
+            if job["attempts"] >= job["max_attempts"]:
+                transaction.update(ref, {
+                    "status": "failed",
+                    "error": job.get("error") or "Interrupted",
+                    "lease_until": None,
+                    "updated_at": now,
+                    "finished_at": now,
+                })
+                return None
+            update = {
+                "status": "running",
+                "attempts": job["attempts"] + 1,
+                "instance": self.instance,
+                "lease_until": now + timedelta(seconds=self.lease),
+                "updated_at": now,
+            }
+            transaction.update(ref, update)
+            job.update(update)
+            return job
+
+        return await self.transact(self.client, claim)
+
+    async def _settle(self, job_id: str, update: Dict[str, Any]) -> bool:
+        """Apply ``update`` only while this instance still owns the running job."""
+        ref = self._ref(job_id)
+
+        async def settle(transaction):
+            snap = await ref.get(transaction=transaction)
+            job = snap.to_dict() if snap.exists else None
+            if not job or job["status"] != "running" or job.get("instance") != self.instance:
+                return False
+            transaction.update(ref, {**update, "updated_at": _now()})
+            return True
+
+        return await self.transact(self.client, settle)
+
+    async def _heartbeat(self, job_id: str, runner: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            renewed = await self._settle(job_id, {"lease_until": _now() + timedelta(seconds=self.lease)})
+            if not renewed:
+                # Cancelled (possibly from another instance) or taken over.
+                runner.cancel()
+                return
+
+    async def _attempt(self, job_id: str) -> Optional[datetime]:
+        """Run one attempt; return when to retry, or ``None`` when done."""
+        snap = await self._ref(job_id).get()
+        if not snap.exists:
+            return None
+        spec = self._types.get(snap.to_dict()["type"])
+        if spec is None:
+            logger.warning(f"Job {job_id} has no registered handler")
+            return None
+
+        async with spec.semaphore:
+            job = await self._claim(job_id)
+            if job is None:
+                return None
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
+            try:
+                result = await spec.handler(job)
+            except asyncio.CancelledError:
+                if self._stopping:
+                    # Hand the attempt back so the next start runs it again.
+                    await self._settle(job_id, {
+                        "status": "queued",
+                        "attempts": job["attempts"] - 1,
+                        "lease_until": None,
+                        "run_after": _now(),
+                    })
+                raise
+            except Exception as e:
+                logger.warning(f"Job {job_id} attempt {job['attempts']} failed: {e}")
+                now = _now()
+                if job["attempts"] >= job["max_attempts"]:
+                    await self._settle(job_id, {
+                        "status": "failed", "error": str(e), "lease_until": None, "finished_at": now,
+                    })
+                    return None
+                run_after = now + timedelta(seconds=spec.backoff * 2 ** (job["attempts"] - 1))
+                await self._settle(job_id, {
+                    "status": "queued", "error": str(e), "lease_until": None, "run_after": run_after,
+                })
+                return run_after
+            finally:
+                heartbeat.cancel()
+
+            await self._settle(job_id, {
+                "status": "succeeded", "result": result, "error": None, "lease_until": None, "finished_at": _now(),
+            })
+            return None
+
+    async def recover(self) -> int:
+        """Schedule queued jobs and running jobs whose lease has expired."""
+        query = self.client.collection(self.collection).where("status", "in", list(ACTIVE_STATUSES))
+        now = _now()
+        scheduled = 0
+        async for snap in query.stream():
+            job = snap.to_dict()
+            if job["type"] not in self._types or job["id"] in self._tasks:
+                continue
+            lease_until = _as_utc(job.get("lease_until"))
+            if job["status"] == "running" and lease_until is not None and lease_until > now:
+                continue
+            self._schedule(job["id"], job.get("run_after") or now)
+            scheduled += 1
+        return scheduled
+
+    async def purge(self) -> int:
+        """Delete jobs, and their stored results, finished more than ``retention`` seconds ago."""
+        cutoff = _now() - timedelta(seconds=self.retention)
+        query = self.client.collection(self.collection).where("finished_at", "<", cutoff)
+        purged = 0
+        async for snap in query.stream():
+            await self._delete_result(snap.id)
+            await snap.reference.delete()
+            purged += 1
+        return purged
+
+    async def _recover_loop(self):
+        while True:
+            try:
+                scheduled = await self.recover()
+                if scheduled:
+                    logger.info(f"Recovered {scheduled} job(s)")
+                purged = await self.purge()
+                if purged:
+                    logger.info(f"Purged {purged} finished job(s)")
+            except Exception:
+                logger.exception("Job recovery failed")
+            await asyncio.sleep(self.lease)
+
+    def start(self):
+        self._stopping = False
+        if self._recovery is None:
+            self._recovery = asyncio.create_task(self._recover_loop())
+
+    async def stop(self):
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if self._recovery is not None:
+            tasks.append(self._recovery)
+            self._recovery = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    def from_env(cls, client, transact):
+        return cls(
+            client,
+            transact,
+            lease=float(os.environ.get("JOB_LEASE_SECONDS", "60")),
+            retention=float(os.environ.get("JOB_RETENTION_SECONDS", "86400")),
+        )
+
+
+__all__ = ["JobQueue", "JobError", "ACTIVE_STATUSES", "FINAL_STATUSES"]
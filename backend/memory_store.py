@@ -0,0 +1,689 @@
+"""In-memory stand-in for the async Firestore client.
+
+Used when no Firebase credentials are configured. Data lives in a
+hierarchical store: each collection path (``("users",)``,
+``("users", uid, "events")``, ...) maps to its documents, so documents can
+own subcollections just like in Firestore.
+
+Every write stores a new immutable version of the document. Snapshots and
+``to_dict()`` hand out read-only views of that version; a view copies the
+data the first time a caller modifies it. Nested values are shared with the
+stored version and must not be mutated in place.
+"""
+import asyncio
+import bisect
+import copy
+import logging
+import mmap
+import os
+import pickle
+import struct
+import uuid
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime, timezone
+from pathlib import Path
+from types import MappingProxyType
+
+
+logger = logging.getLogger(__name__)
+
+_WAL_HEADER = struct.Struct("<I")
+
+
+class DocumentView(MutableMapping):
+    """Read-only view of a stored document version that copies on first write."""
+
+    __slots__ = ("_data", "_owned")
+
+    def __init__(self, data):
+        self._data = data
+        self._owned = False
+
+    def _own(self):
+        if not self._owned:
+            self._data = dict(self._data)
+            self._owned = True
+        return self._data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._own()[key] = value
+
+    def __delitem__(self, key):
+        del self._own()[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return dict(self._data) == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"DocumentView({dict(self._data)!r})"
+
+    def copy(self):
+        return dict(self._data)
+
+
+class InMemorySnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return DocumentView(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+_MISSING = object()
+
+_FILTER_OPS = {
+    "==", "!=", "<", "<=", ">", ">=",
+    "in", "not-in", "array-contains", "array-contains-any",
+}
+
+# Firestore sorts mixed-type values by type first.
+_TYPE_ORDER = {type(None): 0, bool: 1, int: 2, float: 2, datetime: 3, str: 4, bytes: 5}
+
+
+def _sort_key(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    rank = _TYPE_ORDER.get(type(value), 6)
+    if isinstance(value, datetime):
+        rank = 3
+    return (rank, value if rank < 6 else repr(value))
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, Mapping) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _same_type(a, b):
+    return a[0] == b[0]
+
+
+def _matches(data, field_path, op, value):
+    """Evaluate one Firestore filter against a document's data."""
+    actual = _get_field(data, field_path)
+    if actual is _MISSING:
+        return False
+    key = _sort_key(actual)
+    if op == "==":
+        return key == _sort_key(value)
+    if op == "!=":
+        return actual is not None and key != _sort_key(value)
+    if op == "in":
+        return key in {_sort_key(v) for v in value}
+    if op == "not-in":
+        return actual is not None and key not in {_sort_key(v) for v in value}
+    if op == "array-contains":
+        return isinstance(actual, list) and _sort_key(value) in {_sort_key(v) for v in actual}
+    if op == "array-contains-any":
+        return isinstance(actual, list) and bool(
+            {_sort_key(v) for v in actual} & {_sort_key(v) for v in value}
+        )
+    target = _sort_key(value)
+    if not _same_type(key, target):
+        # Range filters only match values of the same type.
+        return False
+    if op == "<":
+        return key < target
+    if op == "<=":
+        return key <= target
+    if op == ">":
+        return key > target
+    if op == ">=":
+        return key >= target
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class _FieldIndex:
+    """Hash and sorted secondary index over one field of a collection."""
+
+    def __init__(self, field_path):
+        self.field_path = field_path
+        self.hash = {}
+        self.keys = []
+        self.ids = []
+
+    def add(self, doc_id, data):
+        value = _get_field(data, self.field_path)
+        if value is _MISSING:
+            return
+        key = _sort_key(value)
+        self.hash.setdefault(key, set()).add(doc_id)
+        pos = bisect.bisect_left(self.keys, key)
+        self.keys.insert(pos, key)
+        self.ids.insert(pos, doc_id)
+
+    def remove(self, doc_id, data):
+        value = _get_field(data, self.field_path)
+        if value is _MISSING:
+            return
+        key = _sort_key(value)
+        bucket = self.hash.get(key)
+        if bucket is not None:
+            bucket.discard(doc_id)
+            if not bucket:
+                del self.hash[key]
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_right(self.keys, key)
+        for pos in range(lo, hi):
+            if self.ids[pos] == doc_id:
+                del self.keys[pos]
+                del self.ids[pos]
+                break
+
+    def lookup(self, op, value):
+        """Return candidate ids for ``op``/``value``, or ``None`` if unindexable."""
+        if op == "==":
+            return set(self.hash.get(_sort_key(value), ()))
+        if op == "in":
+            ids = set()
+            for v in value:
+                ids |= self.hash.get(_sort_key(v), set())
+            return ids
+        if op in ("<", "<=", ">", ">="):
+            key = _sort_key(value)
+            # Restrict to values of the same type, then narrow by bound.
+            lo = bisect.bisect_left(self.keys, (key[0],))
+            hi = bisect.bisect_left(self.keys, (key[0] + 1,))
+            if op == ">":
+                lo = max(lo, bisect.bisect_right(self.keys, key))
+            elif op == ">=":
+                lo = max(lo, bisect.bisect_left(self.keys, key))
+            elif op == "<":
+                hi = min(hi, bisect.bisect_left(self.keys, key))
+            else:
+                hi = min(hi, bisect.bisect_right(self.keys, key))
+            return set(self.ids[lo:hi])
+        return None
+
+
+class _CollectionIndex:
+    """Per-collection field indexes, built lazily on first use and then
+    maintained on every ``set``/``update``/``delete``."""
+
+    def __init__(self):
+        self.fields = {}
+
+    def field(self, field_path, documents):
+        index = self.fields.get(field_path)
+        if index is None:
+            index = _FieldIndex(field_path)
+            for doc_id, data in documents():
+                index.add(doc_id, data)
+            self.fields[field_path] = index
+        return index
+
+    def reindex(self, doc_id, old, new):
+        for index in self.fields.values():
+            if old is not None:
+                index.remove(doc_id, old)
+            if new is not None:
+                index.add(doc_id, new)
+
+
+class _Descending:
+    """Inverts comparisons so descending keys can share one ``sorted`` call."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+class InMemoryQuery:
+    """Immutable query over an in-memory collection.
+
+    Supports ``order_by`` (including composite orderings), ``limit`` and
+    ``start_after``/``start_at`` cursors given as a field-value dict or a
+    snapshot.
+    """
+
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, collection, filters=(), orders=(), limit=None, cursor=None):
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return InMemoryQuery(self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(cursor=(document_fields_or_snapshot, True))
+
+    def count(self, alias=None):
+        return InMemoryAggregationQuery(self).count(alias=alias)
+
+    def sum(self, field, alias=None):
+        return InMemoryAggregationQuery(self).sum(field, alias=alias)
+
+    def _order_key(self, data):
+        return tuple(
+            _Descending(_sort_key(_get_field(data, field))) if direction == self.DESCENDING
+            else _sort_key(_get_field(data, field))
+            for field, direction in self._orders
+        )
+
+    def _cursor_key(self):
+        values, inclusive = self._cursor
+        if hasattr(values, "to_dict"):
+            values = values.to_dict()
+        return self._order_key(values), inclusive
+
+    def _candidates(self):
+        collection = self._collection
+        candidate_ids = None
+        index = collection._index()
+        for field_path, op, value in self._filters:
+            ids = index.field(field_path, collection._documents).lookup(op, value)
+            if ids is None:
+                continue
+            candidate_ids = ids if candidate_ids is None else candidate_ids & ids
+            if not candidate_ids:
+                return
+        if candidate_ids is None:
+            yield from collection._documents()
+            return
+        # Indexes narrow the candidates; every filter is still checked below.
+        for doc_id in sorted(candidate_ids):
+            data = collection._document_data(doc_id)
+            if data:
+                yield doc_id, data
+
+    def _results(self):
+        docs = [
+            (doc_id, data) for doc_id, data in self._candidates()
+            if all(_matches(data, f, op, v) for f, op, v in self._filters)
+            # Like Firestore, ordering on a field excludes documents without it.
+            and all(_get_field(data, field) is not _MISSING for field, _ in self._orders)
+        ]
+        if self._orders:
+            docs.sort(key=lambda item: self._order_key(item[1]))
+            if self._cursor is not None:
+                cursor, inclusive = self._cursor_key()
+                docs = [
+                    item for item in docs
+                    if cursor < self._order_key(item[1])
+                    or (inclusive and not self._order_key(item[1]) < cursor)
+                ]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+    async def stream(self, transaction=None):
+        collection = self._collection
+        for doc_id, data in self._results():
+            yield InMemorySnapshot(collection.document(doc_id), data)
+
+
+class _CollectionData:
+    __slots__ = ("docs", "index")
+
+    def __init__(self):
+        self.docs = {}
+        self.index = _CollectionIndex()
+
+
+class InMemoryDocument:
+    def __init__(self, client, path):
+        self._client = client
+        self._path = tuple(path)
+        self.id = self._path[-1]
+
+    @property
+    def path(self):
+        return "/".join(self._path)
+
+    @property
+    def parent(self):
+        return InMemoryCollection(self._client, self._path[:-1])
+
+    def collection(self, name):
+        return InMemoryCollection(self._client, self._path + (name,))
+
+    def _version(self):
+        data = self._client._collections.get(self._path[:-1])
+        return data.docs.get(self.id) if data is not None else None
+
+    def _next_version(self, op, data, current):
+        """Return the document data after applying ``op`` (``None`` = deleted)."""
+        if op == "delete":
+            return None
+        data = copy.deepcopy(dict(data))
+        if op == "set":
+            return data
+        if op == "update" and current is None:
+            raise KeyError(f"No document to update: {self.path}")
+        return {**(current or {}), **data}
+
+    def _apply(self, op, data=None):
+        self._client._commit([(self._path[:-1], self.id, self._next_version(op, data, self._version()))])
+
+    async def set(self, data, merge=False):
+        self._apply("merge" if merge else "set", data)
+
+    async def update(self, data):
+        self._apply("update", data)
+
+    async def get(self, field_paths=None, transaction=None):
+        return InMemorySnapshot(self, self._version())
+
+    async def delete(self):
+        self._apply("delete")
+
+
+class InMemoryCollection(InMemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(self)
+        self._client = client
+        self._path = tuple(path)
+        self.id = self._path[-1]
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = uuid.uuid4().hex
+        return InMemoryDocument(self._client, self._path + (doc_id,))
+
+    def _data(self):
+        return self._client._collection_data(self._path)
+
+    def _index(self):
+        return self._data().index
+
+    def _document_data(self, doc_id):
+        return self._data().docs.get(doc_id)
+
+    def _documents(self):
+        docs = self._data().docs
+        # Firestore returns unordered results in document id order.
+        for doc_id in sorted(docs):
+            yield doc_id, docs[doc_id]
+
+
+class InMemoryAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class InMemoryAggregationQuery:
+    """Mirrors Firestore's count()/sum() aggregation queries."""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(("count", None, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def sum(self, field, alias=None):
+        self._aggregations.append(("sum", field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    async def get(self):
+        docs = [snap.to_dict() async for snap in self._query.stream()]
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == "count":
+                value = len(docs)
+            else:
+                # Firestore skips values that are missing or not numeric.
+                value = sum(
+                    d[field] for d in docs
+                    if isinstance(d.get(field), (int, float)) and not isinstance(d.get(field), bool)
+                )
+            results.append(InMemoryAggregationResult(alias, value))
+        return [results]
+
+
+class InMemoryWriteBatch:
+    """Buffers writes and applies them together on ``commit``."""
+
+    def __init__(self):
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append((reference, "merge" if merge else "set", document_data))
+
+    def update(self, reference, field_updates):
+        self._ops.append((reference, "update", field_updates))
+
+    def delete(self, reference):
+        self._ops.append((reference, "delete", None))
+
+    async def commit(self):
+        # Every new version is computed before anything is stored, so a
+        # failing write leaves the whole batch unapplied.
+        ops, self._ops = self._ops, []
+        staged = {}
+        for reference, op, data in ops:
+            current = staged[reference._path][1] if reference._path in staged else reference._version()
+            staged[reference._path] = (reference, reference._next_version(op, data, current))
+        if staged:
+            client = next(iter(staged.values()))[0]._client
+            client._commit([
+                (reference._path[:-1], reference.id, data)
+                for reference, data in staged.values()
+            ])
+
+
+class InMemoryTransaction(InMemoryWriteBatch):
+    """Writes are buffered like a batch; ``run_transaction`` serializes callers."""
+
+
+class InMemoryFirestore:
+    """Async stand-in for the Firestore client used when no credentials exist."""
+
+    def __init__(self):
+        self._collections = {}
+        self._transaction_lock = asyncio.Lock()
+
+    def collection(self, name):
+        return InMemoryCollection(self, (name,))
+
+    def document(self, path):
+        return InMemoryDocument(self, tuple(path.split("/")))
+
+    def _collection_data(self, path):
+        data = self._collections.get(path)
+        if data is None:
+            data = self._collections[path] = _CollectionData()
+        return data
+
+    def _commit(self, writes):
+        """Apply ``(collection_path, doc_id, data)`` writes as one unit."""
+        for collection_path, doc_id, data in writes:
+            self._write(collection_path, doc_id, data)
+
+    def _write(self, collection_path, doc_id, data):
+        """Replace a document with ``data`` (``None`` deletes it)."""
+        collection = self._collection_data(collection_path)
+        old = collection.docs.get(doc_id)
+        if data is None:
+            collection.docs.pop(doc_id, None)
+            new = None
+        else:
+            new = MappingProxyType(data)
+            collection.docs[doc_id] = new
+        collection.index.reindex(doc_id, old, new)
+
+    def batch(self):
+        return InMemoryWriteBatch()
+
+    def transaction(self):
+        return InMemoryTransaction()
+
+    async def run_transaction(self, callback):
+        async with self._transaction_lock:
+            transaction = self.transaction()
+            result = await callback(transaction)
+            await transaction.commit()
+            return result
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references:
+            yield await ref.get()
+
+
+class PersistentInMemoryFirestore(InMemoryFirestore):
+    """``InMemoryFirestore`` that survives restarts.
+
+    Each commit (a single write or a whole batch) is appended to
+    ``<data_dir>/wal.log`` as one length-prefixed record before it is applied
+    in memory. Every ``compact_every`` records, the full store is written to
+    ``<data_dir>/snapshot.bin`` and the log is truncated. Startup memory-maps
+    the snapshot, unpickles it straight from the mapping and replays the log.
+    A torn record at the end of the log, left by a crash mid-append, is
+    dropped.
+    """
+
+    SNAPSHOT_MAGIC = b"FLEEMYS1"
+
+    def __init__(self, data_dir, compact_every=10000, fsync=False):
+        super().__init__()
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.data_dir / "snapshot.bin"
+        self.wal_path = self.data_dir / "wal.log"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._wal_records = 0
+        self._load()
+        self._wal = open(self.wal_path, "ab")
+
+    def _load(self):
+        if self.snapshot_path.exists() and self.snapshot_path.stat().st_size > len(self.SNAPSHOT_MAGIC):
+            with open(self.snapshot_path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(self.SNAPSHOT_MAGIC)] != self.SNAPSHOT_MAGIC:
+                    raise ValueError(f"Unrecognized snapshot file: {self.snapshot_path}")
+                with memoryview(mapped) as view:
+                    collections = pickle.loads(view[len(self.SNAPSHOT_MAGIC):])
+            for collection_path, docs in collections.items():
+                data = self._collection_data(collection_path)
+                data.docs = {doc_id: MappingProxyType(doc) for doc_id, doc in docs.items()}
+        if self.wal_path.exists():
+            valid_bytes = 0
+            with open(self.wal_path, "rb") as f:
+                while True:
+                    header = f.read(_WAL_HEADER.size)
+                    if len(header) < _WAL_HEADER.size:
+                        break
+                    (length,) = _WAL_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break
+                    super()._commit(pickle.loads(payload))
+                    valid_bytes += _WAL_HEADER.size + length
+                    self._wal_records += 1
+            if valid_bytes < self.wal_path.stat().st_size:
+                logger.warning("Discarding torn write-log tail in %s", self.wal_path)
+                with open(self.wal_path, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+    def _commit(self, writes):
+        payload = pickle.dumps(
+            [(path, doc_id, None if data is None else dict(data)) for path, doc_id, data in writes],
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        self._wal.write(_WAL_HEADER.pack(len(payload)) + payload)
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+        super()._commit(writes)
+        self._wal_records += 1
+        if self.compact_every and self._wal_records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Write a full snapshot and truncate the write log."""
+        collections = {
+            path: {doc_id: dict(doc) for doc_id, doc in data.docs.items()}
+            for path, data in self._collections.items()
+            if data.docs
+        }
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self.SNAPSHOT_MAGIC)
+            pickle.dump(collections, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._wal.truncate(0)
+        self._wal.seek(0)
+        self._wal_records = 0
+
+    def close(self):
+        if not self._wal.closed:
+            self.compact()
+            self._wal.close()
+
+
+__all__ = [
+    "DocumentView",
+    "InMemoryCollection",
+    "InMemoryDocument",
+    "InMemoryFirestore",
+    "InMemoryQuery",
+    "InMemorySnapshot",
+    "PersistentInMemoryFirestore",
+]
@@ -1,56 +1,495 @@
 import asyncio
-from weasyprint import HTML
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
+from jinja2 import Environment, FileSystemLoader, Undefined, select_autoescape
 
-def _quote_html(quote: dict) -> str:
-    items = "".join(
-        f"<tr><td>{item['description']}</td><td>{item['quantity']}</td><td>{item['unit_price']}</td><td>{item['total']}</td></tr>"
-        for item in quote.get('items', [])
+
+logger = logging.getLogger(__name__)
+
+
+TEMPLATE_DIR = Path(os.environ.get("PDF_TEMPLATE_DIR", str(Path(__file__).parent / "templates")))
+_TEAM_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def _money(value) -> str:
+    if isinstance(value, Undefined) or value is None:
+        return ""
+    try:
+        return f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+# Templates are compiled on first use and kept; they never change while the
+# process runs, so there is no need to stat them on every render.
+_templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+_templates.filters["money"] = _money
+
+
+def _template_version() -> str:
+    digest = hashlib.sha256()
+    for path in sorted(TEMPLATE_DIR.rglob("*")):
+        if path.is_file():
+            digest.update(path.relative_to(TEMPLATE_DIR).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+# Cached PDFs are keyed on this, so editing any template invalidates them.
+TEMPLATE_VERSION = _template_version()
+
+
+def _team_dir(team_id: Optional[str]) -> Optional[str]:
+    return f"teams/{team_id}" if team_id and _TEAM_ID.fullmatch(team_id) else None
+
+
+def render_html(kind: str, document: dict, team_id: Optional[str] = None) -> str:
+    """Render a quote or invoice, preferring the team's branded template."""
+    team_dir = _team_dir(team_id)
+    names = ([f"{team_dir}/{kind}.html"] if team_dir else []) + [f"{kind}.html"]
+    return _templates.select_template(names).render(doc=document)
+
+
+def stylesheets(team_id: Optional[str] = None) -> Tuple[str, ...]:
+    paths = [TEMPLATE_DIR / "pdf.css"]
+    team_dir = _team_dir(team_id)
+    if team_dir:
+        paths.append(TEMPLATE_DIR / team_dir / "pdf.css")
+    return tuple(str(path) for path in paths if path.is_file())
+
+
+def _quote_html(quote: dict, team_id: Optional[str] = None) -> str:
+    return render_html("quote", quote, team_id)
+
+
+def _invoice_html(invoice: dict, team_id: Optional[str] = None) -> str:
+    return render_html("invoice", invoice, team_id)
+
+
+class PDFRenderError(Exception):
+    """Rendering failed because the renderer pool is unavailable."""
+
+
+class PDFRenderBusy(PDFRenderError):
+    """Too many renders are already queued."""
+
+
+class PDFRenderTimeout(PDFRenderError):
+    """A render exceeded the per-render timeout."""
+
+
+@functools.lru_cache(maxsize=1)
+def _font_config():
+    from weasyprint.text.fonts import FontConfiguration
+    return FontConfiguration()
+
+
+@functools.lru_cache(maxsize=64)
+def _stylesheet(path: str):
+    from weasyprint import CSS
+    return CSS(filename=path, font_config=_font_config())
+
+
+def _warm_worker():
+    # Load WeasyPrint, fonts and the default stylesheet once per process
+    # instead of during the first real render.
+    _render_pdf("<p>warm-up</p>", stylesheets())
+
+
+def _render_pdf(html: str, stylesheet_paths: Tuple[str, ...] = ()) -> bytes:
+    """Render in a worker, reusing its parsed stylesheets and font configuration."""
+    from weasyprint import HTML
+    return HTML(string=html, base_url=str(TEMPLATE_DIR)).write_pdf(
+        stylesheets=[_stylesheet(path) for path in stylesheet_paths],
+        font_config=_font_config(),
     )
-    return f"""
-    <html>
-    <head><meta charset='utf-8'><title>Quote {quote.get('quote_number')}</title></head>
-    <body>
-    <h1>Quote {quote.get('quote_number')}</h1>
-    <p>Client: {quote.get('client_name')}</p>
-    <table border='1' cellspacing='0' cellpadding='4'>
-    <tr><th>Description</th><th>Qty</th><th>Unit Price</th><th>Total</th></tr>
-    {items}
-    </table>
-    <p>Subtotal: {quote.get('subtotal')}</p>
-    <p>Tax ({quote.get('tax_rate')}%): {quote.get('tax_amount')}</p>
-    <p>Total: {quote.get('total')}</p>
-    </body></html>
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+
+class PDFRenderPool:
+    """Bounded pool of pre-warmed WeasyPrint worker processes.
+
+    WeasyPrint is CPU-bound and holds the GIL, so renders run in separate
+    processes and never stall the event loop. At most ``max_queue`` renders
+    may be queued or running; more raise :class:`PDFRenderBusy`. A render
+    running longer than ``timeout`` seconds raises :class:`PDFRenderTimeout`
+    and replaces the pool, since a single stuck worker cannot be cancelled;
+    renders in flight on the old pool fail with :class:`PDFRenderError`.
+    Each worker is recycled after ``renders_per_worker`` renders to bound
+    memory growth.
     """
 
+    def __init__(self, workers: int = 2, max_queue: int = 16, timeout: float = 30.0, renders_per_worker: int = 200,
+                 initializer: Optional[Callable[[], None]] = _warm_worker):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.renders_per_worker = renders_per_worker
+        self.initializer = initializer
+        self._executor = None
+        self._pending = 0
 
-def _invoice_html(invoice: dict) -> str:
-    items = "".join(
-        f"<tr><td>{item['description']}</td><td>{item['quantity']}</td><td>{item['unit_price']}</td><td>{item['total']}</td></tr>"
-        for item in invoice.get('items', [])
-    )
-    return f"""
-    <html>
-    <head><meta charset='utf-8'><title>Invoice {invoice.get('invoice_number')}</title></head>
-    <body>
-    <h1>Invoice {invoice.get('invoice_number')}</h1>
-    <p>Client: {invoice.get('client_name')}</p>
-    <table border='1' cellspacing='0' cellpadding='4'>
-    <tr><th>Description</th><th>Qty</th><th>Unit Price</th><th>Total</th></tr>
-    {items}
-    </table>
-    <p>Subtotal: {invoice.get('subtotal')}</p>
-    <p>Tax ({invoice.get('tax_rate')}%): {invoice.get('tax_amount')}</p>
-    <p>Total: {invoice.get('total')}</p>
-    </body></html>
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.environ.get("PDF_WORKERS", "2")),
+            max_queue=int(os.environ.get("PDF_MAX_QUEUE", "16")),
+            timeout=float(os.environ.get("PDF_RENDER_TIMEOUT", "30")),
+            renders_per_worker=int(os.environ.get("PDF_RENDERS_PER_WORKER", "200")),
+        )
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # max_tasks_per_child cannot be combined with fork.
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+                max_tasks_per_child=self.renders_per_worker,
+            )
+        return self._executor
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        if self._executor is pool:
+            self._executor = None
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self):
+        """Spawn and warm every worker so the first requests don't pay for it."""
+        pool = self._pool()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(pool, _worker_pid) for _ in range(self.workers)))
+        except BrokenProcessPool as e:
+            logger.warning(f"PDF renderer failed to start: {e}")
+            self._discard(pool)
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` in a worker, subject to the queue limit and timeout."""
+        if self._pending >= self.max_queue:
+            raise PDFRenderBusy("PDF render queue is full")
+        self._pending += 1
+        pool = self._pool()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._discard(pool)
+            raise PDFRenderTimeout(f"PDF render exceeded {self.timeout:g}s")
+        except BrokenProcessPool as e:
+            self._discard(pool)
+            raise PDFRenderError("PDF renderer is unavailable") from e
+        finally:
+            self._pending -= 1
+
+    async def render(self, html: str, stylesheet_paths: Tuple[str, ...] = ()) -> bytes:
+        return await self.run(_render_pdf, html, stylesheet_paths)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _canonical(value):
+    return dict(value) if isinstance(value, Mapping) else str(value)
+
+
+class PDFCache:
+    """Size-bounded LRU cache of rendered PDFs on local disk.
+
+    Files are named by a hash of the document content and the template
+    version, so an edited document or template simply misses and stale files
+    age out. Recency is tracked in memory and seeded from file mtimes.
+    """
+
+    def __init__(self, directory, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        files = sorted(self.directory.glob("*.pdf"), key=lambda f: f.stat().st_mtime)
+        for file in files:
+            self._entries[file.stem] = file.stat().st_size
+            self._size += self._entries[file.stem]
+        self._evict()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get("PDF_CACHE_DIR", str(Path(tempfile.gettempdir()) / "fleemy-pdf-cache")),
+            max_bytes=int(os.environ.get("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        )
+
+    @staticmethod
+    def key(kind: str, document: Dict[str, Any], team_id: Optional[str] = None) -> str:
+        canonical = json.dumps([kind, TEMPLATE_VERSION, team_id, document], sort_keys=True, default=_canonical)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[Path]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key: str, data: bytes) -> Path:
+        path = self.path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        # The newest entry is kept even when it alone exceeds the limit.
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            self.path(key).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+pdf_renderer = PDFRenderPool.from_env()
+pdf_cache = PDFCache.from_env()
+_inflight: Dict[str, "asyncio.Task"] = {}
+
+
+async def _render_to_cache(key: str, kind: str, document: dict, team_id: Optional[str]) -> Path:
+    data = await pdf_renderer.render(render_html(kind, document, team_id), stylesheets(team_id))
+    return await asyncio.to_thread(pdf_cache.put, key, data)
+
+
+def _render_finished(key: str, task: "asyncio.Task"):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        # Mark the exception as retrieved when every caller has gone.
+        task.exception()
+
+
+async def cached_pdf(kind: str, document: dict, team_id: Optional[str] = None) -> Tuple[str, Path]:
+    """Return ``(key, path)`` of the rendered PDF, rendering it on a miss.
+
+    Concurrent requests for the same content share one render. The render
+    runs in its own task, so a caller that goes away (e.g. a disconnected
+    client) does not abort it for the others.
+    """
+    key = pdf_cache.key(kind, document, team_id)
+    path = pdf_cache.get(key)
+    if path is not None:
+        return key, path
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_to_cache(key, kind, document, team_id))
+        task.add_done_callback(functools.partial(_render_finished, key))
+        _inflight[key] = task
+    return key, await asyncio.shield(task)
+
+
+async def quote_pdf_bytes(quote: dict, team_id: Optional[str] = None) -> bytes:
+    _, path = await cached_pdf("quote", quote, team_id)
+    return await asyncio.to_thread(path.read_bytes)
+
+
+async def invoice_pdf_bytes(invoice: dict, team_id: Optional[str] = None) -> bytes:
+    _, path = await cached_pdf("invoice", invoice, team_id)
+    return await asyncio.to_thread(path.read_bytes)
+
+
+class _ZipSink:
+    """Write-only buffer that ``zipfile`` streams into; drained after each entry."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _write_zip_entry(archive: zipfile.ZipFile, name: str, source, chunk_size: int = 64 * 1024):
+    with source, archive.open(name, "w") as entry:
+        while chunk := source.read(chunk_size):
+            entry.write(chunk)
+
+
+async def _render_with_retry(kind: str, document: dict, team_id: Optional[str], attempts: int = 5) -> Path:
+    for attempt in range(1, attempts + 1):
+        try:
+            _, path = await cached_pdf(kind, document, team_id)
+            return path
+        except PDFRenderBusy:
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(0.5 * attempt)
+
+
+async def stream_pdf_zip(
+    kind: str,
+    documents: AsyncIterable[dict],
+    entry_name: Callable[[dict], str],
+    concurrency: int = 4,
+    team_id: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of the PDFs of ``documents`` as it is produced.
+
+    Up to ``concurrency`` documents render at once and each entry is written
+    as soon as its PDF is ready, so entries follow completion order. Rendered
+    PDFs live in the disk cache and entries are copied from open file handles
+    in chunks; memory stays bounded by ``concurrency`` open files and one
+    entry's output, however many documents there are.
+
+    The response has started by the time anything fails, so failures never
+    propagate: documents that cannot be named, rendered or copied, and a
+    listing that breaks off, are reported in ``errors.txt`` at the end of an
+    archive that is always closed properly.
     """
+    source = documents.__aiter__()
+    source_lock = asyncio.Lock()
+    exhausted = False
+    ready: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    errors: List[str] = []
+    done = object()
 
+    async def next_document() -> Optional[dict]:
+        nonlocal exhausted
+        async with source_lock:
+            if exhausted:
+                return None
+            try:
+                document = await anext(source, None)
+            except Exception as e:
+                logger.warning(f"Listing documents for a {kind} archive failed: {e}")
+                errors.append(f"Listing stopped early: {e}")
+                document = None
+            exhausted = document is None
+            return document
 
-async def quote_pdf_bytes(quote: dict) -> bytes:
-    html = _quote_html(quote)
-    return await asyncio.to_thread(lambda: HTML(string=html).write_pdf())
+    async def worker():
+        while (document := await next_document()) is not None:
+            name = None
+            try:
+                name = f"{entry_name(document)}.pdf"
+                path = await _render_with_retry(kind, document, team_id)
+                # An open handle survives the file being evicted from the cache.
+                handle = open(path, "rb")
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # A render cancelled from elsewhere; this export is still live.
+                logger.warning(f"Skipping {name or 'a document'} in a {kind} archive: render cancelled")
+                errors.append(f"{name or document.get('id', 'document')}: rendering was cancelled")
+                continue
+            except Exception as e:
+                logger.warning(f"Skipping {name or 'a document'} in a {kind} archive: {e}")
+                errors.append(f"{name or document.get('id', 'document')}: {e}")
+                continue
+            try:
+                await ready.put((name, handle))
+            except asyncio.CancelledError:
+                handle.close()
+                raise
 
+    async def run_workers():
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(concurrency):
+                    group.create_task(worker())
+        except Exception as e:
+            logger.exception(f"Building a {kind} archive failed")
+            errors.append(f"Export stopped early: {e}")
+        await ready.put(done)
 
-async def invoice_pdf_bytes(invoice: dict) -> bytes:
-    html = _invoice_html(invoice)
-    return await asyncio.to_thread(lambda: HTML(string=html).write_pdf())
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    producer = asyncio.create_task(run_workers())
+    try:
+        while (item := await ready.get()) is not done:
+            name, handle = item
+            try:
+                await asyncio.to_thread(_write_zip_entry, archive, name, handle)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+            yield sink.drain()
+        await producer
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        producer.cancel()
+        while not ready.empty():
+            item = ready.get_nowait()
+            if item is not done:
+                item[1].close()
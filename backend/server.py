@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header, Depends, Response, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Depends, Response, Request, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
@@ -7,14 +8,38 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import asyncio
 import json
 import calendar
-# from pdf_utils import quote_pdf_bytes, invoice_pdf_bytes
+import functools
+import hashlib
+import base64
+import time
+from jobs import JobError, JobQueue
+from pdf_utils import cached_pdf, pdf_cache, pdf_renderer, stream_pdf_zip, PDFCache, PDFRenderBusy, PDFRenderError, PDFRenderTimeout
 from firebase_admin import auth as firebase_auth
-from firebase import db, InMemoryFirestore
+from firebase import db, InMemoryFirestore, run_transaction
 from google.cloud import firestore
+from cache import LRUCache
+from earnings import STATUSES as EARNING_STATUSES, earnings_totals, planning_earnings
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Decoded ID tokens are cached so repeated requests skip signature checks.
+# Entries never outlive the token's own ``exp`` claim. When revocation checks
+# are enabled they only run on cache misses, so a revoked token may still be
+# accepted for up to TOKEN_CACHE_TTL seconds.
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+CHECK_REVOKED = os.environ.get("FIREBASE_CHECK_REVOKED", "false").lower() == "true"
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 
 async def verify_token(request: Request):
     auth_header = request.headers.get("Authorization")
@@ -22,18 +47,22 @@ async def verify_token(request: Request):
         raise HTTPException(status_code=401, detail="Missing or invalid token")
 
     token = auth_header.split("Bearer ")[1]
-    try:
-        decoded = firebase_auth.verify_id_token(token)
-        request.state.user = decoded
-        return decoded
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+    key = _token_key(token)
+    decoded = token_cache.get(key)
+    if decoded is None:
+        try:
+            # Revocation checks call the Auth API, so keep them off the event loop.
+            decoded = await asyncio.to_thread(firebase_auth.verify_id_token, token, check_revoked=CHECK_REVOKED)
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        ttl = TOKEN_CACHE_TTL
+        if decoded.get("exp"):
+            ttl = min(ttl, decoded["exp"] - time.time())
+        token_cache.set(key, decoded, ttl=ttl)
+    request.state.user = decoded
+    return decoded
 
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -63,6 +92,7 @@ class PlanningEvent(BaseModel):
     uid: str
     week: int
     year: int
+    iso_year: Optional[int] = None  # ISO year of ``week``; ``year`` is the calendar year
     description: str
     client_id: str
     client_name: str
@@ -79,6 +109,7 @@ class WeeklyTask(BaseModel):
     uid: str
     week: int
     year: int
+    iso_year: Optional[int] = None  # ISO year of ``week``; ``year`` is the calendar year
     name: str
     price: float
     color: str
@@ -208,6 +239,10 @@ class TeamCreateRequest(BaseModel):
 class TeamJoinRequest(BaseModel):
     invite_code: str
 
+class JobCreateRequest(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+
 # Firestore helper utilities
 def user_doc(uid: str):
     return db.collection("users").document(uid)
@@ -221,18 +256,300 @@ def team_col(team_id: str, name: str):
     return db.collection("teams").document(team_id).collection(name)
 
 
+# Firestore rejects batches with more than 500 writes.
+BATCH_WRITE_LIMIT = 500
+
+
+async def write_mirrored(uid: str, team_id: Optional[str], name: str, mutations):
+    """Apply ``(op, doc_id, data)`` mutations to a user collection and its team mirror.
+
+    ``op`` is ``"set"``, ``"update"`` or ``"delete"``. Each document's user and
+    team copies are committed in the same WriteBatch, so they cannot diverge.
+    Large mutation lists are split across batches of at most
+    ``BATCH_WRITE_LIMIT`` writes.
+    """
+    scopes = mirror_scopes(uid, team_id)
+
+    def new_batch():
+        # Every batch also bumps the collection's version in each scope, so
+        # cached ETags are invalidated by the same commit as the data.
+        batch = db.batch()
+        stage_version_bump(batch, scopes, name)
+        return batch, len(scopes)
+
+    batch, pending = new_batch()
+    dirty = False
+    for op, doc_id, data in mutations:
+        if pending + len(scopes) > BATCH_WRITE_LIMIT:
+            await batch.commit()
+            batch, pending = new_batch()
+            dirty = False
+        pending += stage_mirrored(batch, scopes, name, op, doc_id, data)
+        dirty = True
+    if dirty:
+        await batch.commit()
+
+
+def mirror_scopes(uid: str, team_id: Optional[str]):
+    return [("users", uid)] + ([("teams", team_id)] if team_id else [])
+
+
+def stage_mirrored(writer, scopes, name: str, op: str, doc_id: str, data) -> int:
+    """Stage one mutation on a batch or transaction for every scope.
+
+    Documents written before the user joined a team have no team copy, so
+    updates are merged into the team scope rather than failing the commit.
+    """
+    for scope in scopes:
+        ref = scope_col(scope, name).document(doc_id)
+        if op == "delete":
+            writer.delete(ref)
+        elif op == "update" and scope[0] == "teams":
+            writer.set(ref, data, merge=True)
+        else:
+            getattr(writer, op)(ref, data)
+    return len(scopes)
+
+
+def stage_version_bump(writer, scopes, name: str):
+    token = uuid.uuid4().hex
+    for scope in scopes:
+        writer.set(version_ref(scope), {name: token}, merge=True)
+
+
+async def write_tracked(uid: str, team_id: Optional[str], name: str, op: str, doc_id: str, data, derive):
+    """Apply one mutation together with the documents derived from it.
+
+    ``await derive(transaction, name, changes)`` receives one
+    ``(scope, before, after)`` change per scope and returns ``(ref, data)``
+    pairs to overwrite. ``before`` is that scope's own copy, which is
+    ``None`` for a team that never received the document. Every copy is
+    overwritten with the user's updated document, the version tokens are
+    bumped and the derived documents are written in one transaction, so
+    summaries move by exactly the difference between the old and new
+    document. Returns the document as written.
+    """
+    scopes = mirror_scopes(uid, team_id)
+    refs = [scope_col(scope, name).document(doc_id) for scope in scopes]
+
+    async def apply(transaction):
+        befores = []
+        for ref in refs:
+            snap = await ref.get(transaction=transaction)
+            befores.append(snap.to_dict() if snap.exists else None)
+        before = befores[0]
+        if op != "set" and before is None:
+            raise HTTPException(status_code=404, detail=f"{name[:-1].capitalize()} not found")
+        after = None if op == "delete" else ({**before, **data} if op == "update" else data)
+        # Transactions must finish reading before they write.
+        derived = await derive(transaction, name, [(scope, b, after) for scope, b in zip(scopes, befores)])
+
+        for ref in refs:
+            if after is None:
+                transaction.delete(ref)
+            else:
+                transaction.set(ref, after)
+        stage_version_bump(transaction, scopes, name)
+        for ref, value in derived:
+            transaction.set(ref, value)
+        return after
+
+    return await run_transaction(db, apply)
+
+
+def scope_col(scope, name: str):
+    kind, owner_id = scope
+    return team_col(owner_id, name) if kind == "teams" else user_col(owner_id, name)
+
+
+def version_ref(scope):
+    """Document holding one change token per collection in ``scope``."""
+    kind, owner_id = scope
+    return db.collection(kind).document(owner_id).collection("meta").document("versions")
+
+
+async def load_versions(scope) -> Dict[str, Any]:
+    snap = await version_ref(scope).get()
+    return snap.to_dict() if snap.exists else {}
+
+
+async def bump_versions(scope, *names: str):
+    token = uuid.uuid4().hex
+    await version_ref(scope).set({name: token for name in names}, merge=True)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match", "")
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def check_etag(request: Request, response: Response, scope, names, *extra, versions: Optional[Dict[str, Any]] = None) -> Optional[Response]:
+    """Derive a strong ETag from the scope's change tokens for ``names``.
+
+    Returns a 304 response when it matches ``If-None-Match``; otherwise sets
+    the ETag on ``response`` and returns ``None`` so the handler runs its
+    queries. Only the small versions document is read either way, unless
+    the caller passes the ``versions`` it already loaded. Bodies served from
+    a cache must be validated against the same tokens, or a fresh ETag could
+    label stale data.
+    """
+    if versions is None:
+        versions = await load_versions(scope)
+    payload = json.dumps([[versions.get(name) for name in names], *extra], default=str)
+    etag = '"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 async def stream_docs(query):
-    docs = await asyncio.to_thread(lambda: list(query.stream()))
-    return [d.to_dict() for d in docs]
+    return [d.to_dict() async for d in query.stream()]
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(doc: Dict[str, Any], order_field: str) -> str:
+    value = doc.get(order_field)
+    payload = {"id": doc["id"]}
+    if isinstance(value, datetime):
+        payload["ts"] = value.isoformat()
+    else:
+        payload["v"] = value
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["ts"]) if "ts" in payload else payload["v"]
+        return value, payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_page(query, order_field: str, direction: str, limit: Optional[int], cursor: Optional[str]):
+    """List ``query`` whole, or one page of it when ``limit``/``cursor`` is given.
+
+    Pages are ordered by ``order_field`` then document id, so the opaque
+    ``next_cursor`` resumes exactly after the last returned document.
+    """
+    if limit is None and cursor is None:
+        return await stream_docs(query.order_by(order_field, direction=direction))
+    limit = limit or DEFAULT_PAGE_SIZE
+    query = query.order_by(order_field, direction=direction).order_by("id", direction=direction)
+    if cursor:
+        value, doc_id = decode_cursor(cursor)
+        query = query.start_after({order_field: value, "id": doc_id})
+    docs = await stream_docs(query.limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1], order_field) if len(docs) > limit else None
+    return {"items": docs[:limit], "next_cursor": next_cursor}
+
+
+async def aggregate(query, sums=()):
+    """Count the documents matching ``query`` and sum ``sums`` fields server-side.
+
+    Returns ``{"count": n, field: total, ...}`` without transferring documents.
+    """
+    aggregation = query.count(alias="count")
+    for field in sums:
+        aggregation = aggregation.sum(field, alias=field)
+    rows = await aggregation.get()
+    values = {result.alias: result.value for row in rows for result in row}
+    return {alias: values.get(alias) or 0 for alias in ("count", *sums)}
+
+
+# Profiles are read by most handlers just to learn ``team_id`` or
+# ``hourly_rate``. FastAPI resolves a dependency once per request, and the
+# short-lived process cache below lets consecutive read-only requests share
+# the read. Set PROFILE_CACHE_TTL=0 to disable it; profile writes call
+# ``profile_cache.pop`` so this process never serves its own stale data.
+# Handlers that write use ``get_fresh_user_profile``: a team set up through
+# another instance must be mirrored from the very next write.
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "30"))
+profile_cache = LRUCache(maxsize=int(os.environ.get("PROFILE_CACHE_SIZE", "4096")), ttl=PROFILE_CACHE_TTL)
+
+
+async def load_user_profile(uid: str, cached: bool = True) -> Optional[Dict[str, Any]]:
+    if cached and PROFILE_CACHE_TTL > 0:
+        profile = profile_cache.get(uid)
+        if profile is not None:
+            return profile
+    snap = await user_doc(uid).get()
+    profile = snap.to_dict() if snap.exists else None
+    if profile is not None and PROFILE_CACHE_TTL > 0:
+        profile_cache.set(uid, profile)
+    return profile
+
+
+async def get_user_profile(user: Dict[str, Any] = Depends(verify_token)) -> Optional[Dict[str, Any]]:
+    """Load the authenticated user's profile document, or ``None`` if missing."""
+    return await load_user_profile(user["uid"])
+
+
+async def get_fresh_user_profile(user: Dict[str, Any] = Depends(verify_token)) -> Optional[Dict[str, Any]]:
+    """Like :func:`get_user_profile`, but always reads the database."""
+    return await load_user_profile(user["uid"], cached=False)
+
+# Document number prefix and field per numbered collection.
+SEQUENCE_FORMATS = {
+    "quotes": ("DEV", "quote_number"),
+    "invoices": ("FACT", "invoice_number"),
+}
+
+
+async def _legacy_sequence(uid: str, kind: str, year: int) -> int:
+    """Highest number already issued for ``year`` before counters existed."""
+    prefix, field = SEQUENCE_FORMATS[kind]
+    year_prefix = f"{prefix}-{year}-"
+    latest = await stream_docs(
+        user_col(uid, kind)
+        .where(field, ">=", year_prefix)
+        .where(field, "<", year_prefix + "\uf8ff")
+        .order_by(field, direction=firestore.Query.DESCENDING)
+        .limit(1)
+    )
+    if not latest:
+        return 0
+    try:
+        return int(latest[0][field].rsplit("-", 1)[1])
+    except (KeyError, ValueError, IndexError):
+        return 0
+
+
+async def next_document_number(uid: str, kind: str) -> str:
+    """Allocate the next ``PREFIX-YYYY-NNNN`` number from a per-year counter.
+
+    The counter document is incremented in a transaction, so concurrent
+    creates never receive the same number.
+    """
+    prefix, _ = SEQUENCE_FORMATS[kind]
+    year = datetime.now().year
+    counter_ref = user_col(uid, "counters").document(f"{kind}-{year}")
+
+    async def allocate(transaction):
+        snap = await counter_ref.get(transaction=transaction)
+        if snap.exists:
+            value = snap.to_dict().get("value", 0)
+        else:
+            value = await _legacy_sequence(uid, kind, year)
+        value += 1
+        transaction.set(counter_ref, {"value": value, "year": year, "updated_at": datetime.utcnow()})
+        return value
+
+    value = await run_transaction(db, allocate)
+    return f"{prefix}-{year}-{value:04d}"
 
 # Authentication endpoints
 
 @api_router.get("/auth/me")
-async def get_me(user: Dict[str, Any] = Depends(verify_token)):
+async def get_me(user: Dict[str, Any] = Depends(verify_token), db_user: Optional[Dict[str, Any]] = Depends(get_user_profile)):
     """Return the authenticated user's info and create the DB entry if missing."""
-    user_ref = user_doc(user["uid"])
-    snapshot = await asyncio.to_thread(user_ref.get)
-    db_user = snapshot.to_dict() if snapshot.exists else None
     if not db_user:
         new_user = User(
             uid=user["uid"],
@@ -240,7 +557,9 @@ async def get_me(user: Dict[str, Any] = Depends(verify_token)):
             email=user.get("email", ""),
             picture=user.get("picture"),
         )
-        await asyncio.to_thread(user_ref.set, new_user.dict())
+        await user_doc(user["uid"]).set(new_user.dict())
+        await bump_versions(("users", user["uid"]), "profile")
+        profile_cache.pop(user["uid"])
         db_user = new_user.dict()
     return {
         "uid": db_user["uid"],
@@ -254,315 +573,605 @@ async def get_me(user: Dict[str, Any] = Depends(verify_token)):
 @api_router.put("/auth/me")
 async def update_me(hourly_rate: float, user: Dict[str, Any] = Depends(verify_token)):
     user_ref = user_doc(user["uid"])
-    await asyncio.to_thread(user_ref.update, {"hourly_rate": hourly_rate})
-    updated_user = await asyncio.to_thread(user_ref.get)
+    await user_ref.update({"hourly_rate": hourly_rate})
+    await bump_versions(("users", user["uid"]), "profile")
+    profile_cache.pop(user["uid"])
+    updated_user = await user_ref.get()
     return User(**updated_user.to_dict())
 
 # Dashboard endpoint
-@api_router.get("/dashboard")
-async def get_dashboard(user: Dict[str, Any] = Depends(verify_token)):
-    """Return dashboard data for the authenticated user."""
-    user_ref = user_doc(user["uid"])
-    snapshot = await asyncio.to_thread(user_ref.get)
-    current_user = snapshot.to_dict() if snapshot.exists else None
-    if not current_user:
-        raise HTTPException(status_code=404, detail="User not found")
+DASHBOARD_QUERY_CONCURRENCY = int(os.environ.get("DASHBOARD_QUERY_CONCURRENCY", "8"))
+DASHBOARD_COLLECTIONS = ("profile", "events", "todos", "clients", "quotes", "invoices")
 
-    now = datetime.utcnow()
-    current_week = now.isocalendar()[1]
-    current_year = now.year
 
-    events_ref = user_col(current_user["uid"], "events")\
-        .where("year", "==", current_year)\
-        .where("week", "in", [current_week, current_week + 1])\
-        .limit(5)
-    upcoming_events = await stream_docs(events_ref)
+async def gather_timed(queries: Dict[str, Any], limit: int):
+    """Await named coroutines concurrently, at most ``limit`` at a time.
 
-    pending_todos = await stream_docs(
-        user_col(current_user["uid"], "todos").where("completed", "==", False).limit(5)
-    )
+    Returns the results keyed by name and each query's duration in ms.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    timings: Dict[str, float] = {}
 
-    recent_clients = await stream_docs(
-        user_col(current_user["uid"], "clients").order_by("created_at", direction=firestore.Query.DESCENDING).limit(5)
-    )
+    async def run(name, coro):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[name] = (time.perf_counter() - started) * 1000
 
-    pending_quotes = await stream_docs(
-        user_col(current_user["uid"], "quotes").where("status", "in", ["draft", "sent", "accepted"]).limit(5)
-    )
+    values = await asyncio.gather(*(run(name, coro) for name, coro in queries.items()))
+    return dict(zip(queries, values)), timings
 
-    unpaid_invoices = await stream_docs(
-        user_col(current_user["uid"], "invoices").where("status", "in", ["sent", "overdue"]).limit(5)
-    )
 
-    invoices = await stream_docs(user_col(current_user["uid"], "invoices"))
-    quotes = await stream_docs(user_col(current_user["uid"], "quotes"))
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
 
-    revenue = {"paid": 0.0, "unpaid": 0.0, "pending": 0.0}
-    for inv in invoices:
-        if inv.get("status") == "paid":
-            revenue["paid"] += inv.get("total", 0)
-        elif inv.get("status") in ["sent", "overdue"]:
-            revenue["unpaid"] += inv.get("total", 0)
 
-    for q in quotes:
-        if q.get("status") in ["draft", "sent", "accepted"]:
-            revenue["pending"] += q.get("total", 0)
+@api_router.get("/dashboard")
+async def get_dashboard(request: Request, response: Response, user: Dict[str, Any] = Depends(verify_token)):
+    """Return dashboard data for the authenticated user."""
+    now = datetime.utcnow()
+    current_week = now.isocalendar()[1]
+    current_year = now.year
+    uid = user["uid"]
+
+    not_modified = await check_etag(
+        request, response, ("users", uid), DASHBOARD_COLLECTIONS, current_year, current_week
+    )
+    if not_modified:
+        return not_modified
+
+    # The profile is read uncached: the ETag covers its version token, so a
+    # body built from a stale cached copy would be pinned by later 304s.
+    results, timings = await gather_timed({
+        "profile": load_user_profile(uid, cached=False),
+        "upcoming_events": stream_docs(
+            user_col(uid, "events")
+            .where("year", "==", current_year)
+            .where("week", "in", [current_week, current_week + 1])
+            .limit(5)
+        ),
+        "pending_todos": stream_docs(
+            user_col(uid, "todos").where("completed", "==", False).limit(5)
+        ),
+        "recent_clients": stream_docs(
+            user_col(uid, "clients").order_by("created_at", direction=firestore.Query.DESCENDING).limit(5)
+        ),
+        "pending_quotes": stream_docs(
+            user_col(uid, "quotes").where("status", "in", ["draft", "sent", "accepted"]).limit(5)
+        ),
+        "unpaid_invoices": stream_docs(
+            user_col(uid, "invoices").where("status", "in", ["sent", "overdue"]).limit(5)
+        ),
+        "revenue_summary": load_revenue_summary(uid),
+        "clients_agg": aggregate(user_col(uid, "clients")),
+        "pending_todos_agg": aggregate(user_col(uid, "todos").where("completed", "==", False)),
+    }, DASHBOARD_QUERY_CONCURRENCY)
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    current_user = results["profile"]
+    if not current_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    totals = revenue_totals(results["revenue_summary"])
+    revenue = {key: totals[key] for key in ("paid", "unpaid", "pending")}
 
     return {
         "user": {
-            "uid": current_user["uid"],
+            "uid": uid,
             "name": current_user.get("name"),
             "email": current_user.get("email"),
             "picture": current_user.get("picture"),
             "hourly_rate": current_user.get("hourly_rate"),
         },
-        "upcoming_events": upcoming_events,
-        "pending_todos": pending_todos,
-        "recent_clients": recent_clients,
-        "pending_quotes": pending_quotes,
-        "unpaid_invoices": unpaid_invoices,
+        "upcoming_events": results["upcoming_events"],
+        "pending_todos": results["pending_todos"],
+        "recent_clients": results["recent_clients"],
+        "pending_quotes": results["pending_quotes"],
+        "unpaid_invoices": results["unpaid_invoices"],
         "revenue": revenue,
         "stats": {
-            "total_clients": len(await stream_docs(user_col(current_user["uid"], "clients"))),
-            "pending_todos_count": len(await stream_docs(user_col(current_user["uid"], "todos").where("completed", "==", False))),
-            "unpaid_invoices_count": len(unpaid_invoices),
+            "total_clients": results["clients_agg"]["count"],
+            "pending_todos_count": results["pending_todos_agg"]["count"],
+            "unpaid_invoices_count": totals["unpaid_invoices_count"],
         },
     }
 
 # Planning endpoints
-@api_router.get("/planning/week/{year}/{week}")
-async def get_week_planning(year: int, week: int, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+async def planning_scope(user: Dict[str, Any], team_id: Optional[str]):
+    """Return the ``(kind, owner_id)`` scope whose planning the user may read."""
     if team_id:
-        team_snap = await asyncio.to_thread(db.collection("teams").document(team_id).get)
+        team_snap = await db.collection("teams").document(team_id).get()
         team = team_snap.to_dict() if team_snap.exists else None
         if not team or user["uid"] not in (team.get("members", []) + [team.get("created_by")]):
             raise HTTPException(status_code=403, detail="Not authorized for this team")
-        events_ref = team_col(team_id, "events")
-        tasks_ref = team_col(team_id, "tasks")
-    else:
-        events_ref = user_col(user["uid"], "events")
-        tasks_ref = user_col(user["uid"], "tasks")
+        return ("teams", team_id)
+    return ("users", user["uid"])
+
+
+# Read-through cache of a scope's events and tasks for one ISO week. Each
+# entry remembers the scope's ``events`` and ``tasks`` version tokens it was
+# loaded under and is only served while they are still current, so a write
+# through any instance invalidates it. The tokens are read before the
+# queries: a write racing the load leaves an entry that simply misses.
+week_cache = LRUCache(
+    maxsize=int(os.environ.get("WEEK_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("WEEK_CACHE_TTL", "60")),
+)
 
-    events = await stream_docs(events_ref.where("year", "==", year).where("week", "==", week))
-    tasks = await stream_docs(tasks_ref.where("year", "==", year).where("week", "==", week))
 
-    return {"events": events, "tasks": tasks}
+async def load_week(scope, year: int, week: int, versions: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    if versions is None:
+        versions = await load_versions(scope)
+    tokens = (versions.get("events"), versions.get("tasks"))
+    key = (*scope, year, week)
+    cached = week_cache.get(key)
+    if cached is not None and cached[0] == tokens:
+        return cached[1]
+    events, tasks = await asyncio.gather(
+        stream_docs(scope_col(scope, "events").where("year", "==", year).where("week", "==", week)),
+        stream_docs(scope_col(scope, "tasks").where("year", "==", year).where("week", "==", week)),
+    )
+    planning = {"events": events, "tasks": tasks}
+    week_cache.set(key, (tokens, planning))
+    return planning
 
-@api_router.get("/planning/month/{year}/{month}")
-async def get_month_planning(year: int, month: int, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+
+def invalidate_week(uid: str, team_id: Optional[str], year: Optional[int], week: Optional[int]):
+    """Drop this process's cached week in the user's scope and in its team mirror.
+
+    Other instances notice the write through the version tokens instead.
+    """
+    for scope in mirror_scopes(uid, team_id):
+        week_cache.pop((*scope, year, week))
+
+@api_router.get("/planning/week/{year}/{week}")
+async def get_week_planning(year: int, week: int, request: Request, response: Response, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    scope = await planning_scope(user, team_id)
+    # The ETag and the cached body are checked against the same tokens.
+    versions = await load_versions(scope)
+    not_modified = await check_etag(request, response, scope, ("events", "tasks"), year, week, versions=versions)
+    if not_modified:
+        return not_modified
+    return await load_week(scope, year, week, versions)
+
+@functools.lru_cache(maxsize=256)
+def month_week_pairs(year: int, month: int):
+    """Return the sorted ISO ``(year, week)`` pairs overlapping ``month``."""
     last_day = calendar.monthrange(year, month)[1]
-    pairs = {
-        (datetime(year, month, day).isocalendar().year,
-         datetime(year, month, day).isocalendar().week)
+    return tuple(sorted({
+        tuple(datetime(year, month, day).isocalendar()[:2])
         for day in range(1, last_day + 1)
-    }
-    or_filters = [{"year": y, "week": w} for y, w in pairs]
+    }))
 
-    if team_id:
-        team_snap = await asyncio.to_thread(db.collection("teams").document(team_id).get)
-        team = team_snap.to_dict() if team_snap.exists else None
-        if not team or user["uid"] not in (team.get("members", []) + [team.get("created_by")]):
-            raise HTTPException(status_code=403, detail="Not authorized for this team")
-        events_ref = team_col(team_id, "events")
-        tasks_ref = team_col(team_id, "tasks")
-    else:
-        events_ref = user_col(user["uid"], "events")
-        tasks_ref = user_col(user["uid"], "tasks")
 
-    events: List[Dict[str, Any]] = []
-    tasks: List[Dict[str, Any]] = []
-    for y, w in pairs:
-        events += await stream_docs(events_ref.where("year", "==", y).where("week", "==", w))
-        tasks += await stream_docs(tasks_ref.where("year", "==", y).where("week", "==", w))
+def dedupe_by_id(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    seen = set()
+    unique = []
+    for doc in docs:
+        key = doc.get("id")
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        unique.append(doc)
+    return unique
+
+
+@api_router.get("/planning/month/{year}/{month}")
+async def get_month_planning(year: int, month: int, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    pairs = month_week_pairs(year, month)
+    scope = await planning_scope(user, team_id)
+
+    # Every ISO week is loaded at once and shares the week cache.
+    versions = await load_versions(scope)
+    weeks = await asyncio.gather(*(load_week(scope, y, w, versions) for y, w in pairs))
+    events = dedupe_by_id([doc for data in weeks for doc in data["events"]])
+    tasks = dedupe_by_id([doc for data in weeks for doc in data["tasks"]])
 
     return {"events": events, "tasks": tasks}
 
 @api_router.get("/planning/events")
-async def list_events(year: Optional[int] = None, week: Optional[int] = None, user: Dict[str, Any] = Depends(verify_token)):
+async def list_events(year: Optional[int] = None, week: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
     events_ref = user_col(user["uid"], "events")
     if year is not None:
         events_ref = events_ref.where("year", "==", year)
     if week is not None:
         events_ref = events_ref.where("week", "==", week)
-    events = await stream_docs(events_ref)
-    return events
+    if limit is None and cursor is None:
+        return await stream_docs(events_ref)
+    return await list_page(events_ref, "created_at", firestore.Query.ASCENDING, limit, cursor)
 
 @api_router.post("/planning/events")
-async def create_event(event_request: EventCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def create_event(event_request: EventCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     now = datetime.now()
     year = now.year
-    week = now.isocalendar()[1]
+    iso_year, week = now.isocalendar()[:2]
     
     event = PlanningEvent(
         uid=user["uid"],
         week=week,
         year=year,
+        iso_year=iso_year,
         **event_request.dict()
     )
-    await asyncio.to_thread(user_col(user["uid"], "events").document(event.id).set, event.dict())
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "events").document(event.id).set, event.dict())
+    team_id = profile.get("team_id") if profile else None
+    await write_planning(user["uid"], team_id, "events", "set", event.id, event.dict())
+    invalidate_week(user["uid"], team_id, event.year, event.week)
     return event
 
 @api_router.put("/planning/events/{event_id}")
-async def update_event(event_id: str, event_request: EventCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def update_event(event_id: str, event_request: EventCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     update_data = {**event_request.dict(), "updated_at": datetime.utcnow()}
-    await asyncio.to_thread(user_col(user["uid"], "events").document(event_id).update, update_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "events").document(event_id).update, update_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "events").document(event_id).get)
-    return updated.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    event = await write_planning(user["uid"], team_id, "events", "update", event_id, update_data)
+    invalidate_week(user["uid"], team_id, event.get("year"), event.get("week"))
+    return event
 
 @api_router.delete("/planning/events/{event_id}")
-async def delete_event(event_id: str, user: Dict[str, Any] = Depends(verify_token)):
+async def delete_event(event_id: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     doc_ref = user_col(user["uid"], "events").document(event_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+    snap = await doc_ref.get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Event not found")
-    await asyncio.to_thread(doc_ref.delete)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "events").document(event_id).delete)
+    team_id = profile.get("team_id") if profile else None
+    await write_planning(user["uid"], team_id, "events", "delete", event_id)
+    event = snap.to_dict()
+    invalidate_week(user["uid"], team_id, event.get("year"), event.get("week"))
     return {"message": "Event deleted"}
 
+# Weekly earnings rollups: per-status amounts and hours of a scope's events
+# and tasks for one ISO week, kept in {scope}/earnings_rollups/{year}-{week}
+# and moved by delta in the same transaction as every event or task write.
+# Rollups written under another ROLLUP_VERSION (i.e. an older earnings rule)
+# are recomputed on their next read or write.
+ROLLUP_VERSION = 2
+
+
+def rollup_ref(scope, year: int, week: int):
+    return scope_col(scope, "earnings_rollups").document(f"{year}-{week:02d}")
+
+
+def empty_rollup(year: int, week: int) -> Dict[str, Any]:
+    return {
+        "year": year,
+        "week": week,
+        "version": ROLLUP_VERSION,
+        "amounts": {status: 0.0 for status in EARNING_STATUSES},
+        "hours": {status: 0.0 for status in EARNING_STATUSES},
+    }
+
+
+def current_rollup(snap) -> Optional[Dict[str, Any]]:
+    data = snap.to_dict() if snap.exists else None
+    return data if data and data.get("version") == ROLLUP_VERSION else None
+
+
+def copy_rollup(data: Dict[str, Any]) -> Dict[str, Any]:
+    rollup = empty_rollup(data["year"], data["week"])
+    for field in ("amounts", "hours"):
+        rollup[field].update(data.get(field) or {})
+    return rollup
+
+
+def fold_into_rollup(rollup: Dict[str, Any], name: str, doc: Optional[Dict[str, Any]], sign: int):
+    if not doc or (doc.get("year"), doc.get("week")) != (rollup["year"], rollup["week"]):
+        return
+    for status, amount, hours in planning_earnings(name, doc):
+        rollup["amounts"][status] += sign * amount
+        rollup["hours"][status] += sign * hours
+
+
+def rollups_from(events, tasks) -> Dict[Any, Dict[str, Any]]:
+    """Compute rollups for every ``(year, week)`` found in ``events`` and ``tasks``."""
+    def week_of(doc):
+        return (doc.get("year"), doc.get("week"))
+
+    rollups = {}
+    for (year, week), totals in earnings_totals(events, tasks, key=week_of).items():
+        if year is None or week is None:
+            continue
+        rollup = empty_rollup(year, week)
+        rollup["amounts"].update(totals["amounts"])
+        rollup["hours"].update(totals["hours"])
+        rollups[(year, week)] = rollup
+    return rollups
+
+
+async def compute_week_rollup(scope, year: int, week: int, transaction=None) -> Dict[str, Any]:
+    docs = {}
+    for name in ("events", "tasks"):
+        query = scope_col(scope, name).where("year", "==", year).where("week", "==", week)
+        docs[name] = [snap.to_dict() async for snap in query.stream(transaction=transaction)]
+    return rollups_from(docs["events"], docs["tasks"]).get((year, week)) or empty_rollup(year, week)
+
+
+async def rollup_delta(transaction, name: str, changes):
+    """Fold an event or task change into the rollups of the weeks it touches.
+
+    A week without a current rollup is first computed from the scope's
+    documents as they were before this change.
+    """
+    updates = []
+    for scope, before, after in changes:
+        weeks = {(doc.get("year"), doc.get("week")) for doc in (before, after) if doc}
+        for year, week in weeks:
+            if year is None or week is None:
+                continue
+            ref = rollup_ref(scope, year, week)
+            current = current_rollup(await ref.get(transaction=transaction))
+            if current:
+                rollup = copy_rollup(current)
+            else:
+                rollup = await compute_week_rollup(scope, year, week, transaction)
+            fold_into_rollup(rollup, name, before, -1)
+            fold_into_rollup(rollup, name, after, 1)
+            rollup["updated_at"] = datetime.utcnow()
+            updates.append((ref, rollup))
+    return updates
+
+
+async def write_planning(uid: str, team_id: Optional[str], name: str, op: str, doc_id: str, data=None):
+    """Apply one event or task mutation and fold it into the weekly rollups."""
+    return await write_tracked(uid, team_id, name, op, doc_id, data, rollup_delta)
+
+
+async def load_week_rollup(scope, year: int, week: int) -> Dict[str, Any]:
+    ref = rollup_ref(scope, year, week)
+    current = current_rollup(await ref.get())
+    if current:
+        return current
+
+    async def build(transaction):
+        current = current_rollup(await ref.get(transaction=transaction))
+        if current:
+            return current
+        rollup = await compute_week_rollup(scope, year, week, transaction)
+        rollup["updated_at"] = datetime.utcnow()
+        transaction.set(ref, rollup)
+        return rollup
+
+    return await run_transaction(db, build)
+
+
+async def backfill_earnings_rollups(scope) -> int:
+    """Recompute every weekly rollup of ``scope`` from its events and tasks.
+
+    Rollups of weeks that no longer have any event or task are deleted, so
+    drift left behind by removed documents is repaired too. Meant for
+    migrating existing data and repairing drift; writes racing the backfill
+    may need another run. Returns the number of weeks written.
+    """
+    async def stored_rollups():
+        return [snap async for snap in scope_col(scope, "earnings_rollups").stream()]
+
+    events, tasks, stored = await asyncio.gather(
+        stream_docs(scope_col(scope, "events")), stream_docs(scope_col(scope, "tasks")), stored_rollups()
+    )
+    rollups = rollups_from(events, tasks)
+    live = {rollup_ref(scope, year, week).id for year, week in rollups}
+
+    now = datetime.utcnow()
+    writes = [(rollup_ref(scope, year, week), {**rollup, "updated_at": now}) for (year, week), rollup in rollups.items()]
+    writes += [(snap.reference, None) for snap in stored if snap.id not in live]
+    for i in range(0, len(writes), BATCH_WRITE_LIMIT):
+        batch = db.batch()
+        for ref, data in writes[i:i + BATCH_WRITE_LIMIT]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        await batch.commit()
+    return len(rollups)
+
+
+@api_router.post("/planning/earnings/rollups/backfill")
+async def backfill_rollups(team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    scope = await planning_scope(user, team_id)
+    return {"weeks": await backfill_earnings_rollups(scope)}
+
 @api_router.get("/planning/earnings/{year}/{week}")
-async def get_earnings(year: int, week: int, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    db_user = user_snap.to_dict() if user_snap.exists else None
+async def get_earnings(year: int, week: int, team_id: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token), db_user: Optional[Dict[str, Any]] = Depends(get_user_profile)):
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if team_id:
-        team_snap = await asyncio.to_thread(db.collection("teams").document(team_id).get)
-        team = team_snap.to_dict() if team_snap.exists else None
-        if not team or user["uid"] not in (team.get("members", []) + [team.get("created_by")]):
-            raise HTTPException(status_code=403, detail="Not authorized for this team")
-        events_ref = team_col(team_id, "events")
-        tasks_ref = team_col(team_id, "tasks")
-    else:
-        events_ref = user_col(user["uid"], "events")
-        tasks_ref = user_col(user["uid"], "tasks")
+    scope = await planning_scope(user, team_id)
+    rollup = await load_week_rollup(scope, year, week)
+    amounts = rollup.get("amounts") or {}
 
-    events = await stream_docs(events_ref.where("year", "==", year).where("week", "==", week))
-    tasks = await stream_docs(tasks_ref.where("year", "==", year).where("week", "==", week))
-    
-    earnings = {
-        "paid": 0,
-        "unpaid": 0,
-        "pending": 0,
-        "not_worked": 0,
-        "total": 0
-    }
-    
-    # Calculate earnings from events based on hours and rate
+    earnings = {status: amounts.get(status, 0) for status in EARNING_STATUSES}
+    earnings["total"] = earnings["paid"] + earnings["unpaid"] + earnings["pending"]
+
+    return earnings
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MAX_EARNINGS_RANGE_DAYS = int(os.environ.get("MAX_EARNINGS_RANGE_DAYS", str(5 * 366)))
+
+
+def planning_iso_year(doc: Dict[str, Any]) -> Optional[int]:
+    """ISO year of a planning entry's ``week``.
+
+    Older entries only store the calendar year they were created in next to
+    the ISO week, which differ around New Year (e.g. 2025-12-29 is in week 1
+    of 2026). For those the ISO year is recovered from ``created_at``, or
+    failing that from whether ``year`` has the stored week at all.
+    """
+    if doc.get("iso_year") is not None:
+        return doc["iso_year"]
+    year, week = doc.get("year"), doc.get("week")
+    if not isinstance(year, int) or not isinstance(week, int):
+        return None
+    created = doc.get("created_at")
+    if isinstance(created, datetime) and created.year == year:
+        created_year, created_week, _ = created.isocalendar()
+        if created_week == week:
+            return created_year
+    if week == 53 and date(year, 12, 28).isocalendar()[1] != 53:
+        return year - 1
+    return year
+
+
+def planning_date(doc: Dict[str, Any], day: Optional[str]) -> Optional[date]:
+    """Calendar date of a planning entry; unknown days fall on the week's Monday."""
+    weekday = WEEKDAYS.index(day) + 1 if day in WEEKDAYS else 1
+    try:
+        return date.fromisocalendar(planning_iso_year(doc), doc["week"], weekday)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def planning_years(start: date, end: date) -> List[int]:
+    """Calendar years stored on entries whose ISO week overlaps ``start``..``end``.
+
+    Entries store the calendar year they were created in, so a range only
+    reaches into a neighbouring year when one of its ISO weeks straddles New
+    Year.
+    """
+    first = start - timedelta(days=start.weekday())
+    last = end + timedelta(days=6 - end.weekday())
+    return list(range(first.year, last.year + 1))
+
+
+def earnings_bucket(group_by: str, day: date, doc: Dict[str, Any]):
+    if group_by == "client":
+        return (doc.get("client_id"), doc.get("client_name"))
+    if group_by == "month":
+        key = f"{day.year}-{day.month:02d}"
+    else:
+        iso_year, iso_week, _ = day.isocalendar()
+        key = f"{iso_year}-W{iso_week:02d}"
+    return (key, key)
+
+
+@api_router.get("/planning/earnings/range")
+async def get_earnings_range(
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    group_by: str = Query("week", pattern="^(week|month|client)$"),
+    team_id: Optional[str] = None,
+    user: Dict[str, Any] = Depends(verify_token),
+):
+    """Earnings between two dates (inclusive), broken down per bucket.
+
+    Events and tasks are read with one query each and aggregated in a single
+    vectorized pass. Task time slots are placed on their own day, so a task
+    can contribute to several buckets. Tasks have no client and fall in the
+    ``null`` client bucket.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (end - start).days > MAX_EARNINGS_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail="Date range too large")
+    scope = await planning_scope(user, team_id)
+
+    # ``year`` is a calendar year next to an ISO week: read the years whose
+    # weeks overlap the range and filter on the exact date below.
+    years = planning_years(start, end)
+
+    def in_years(name):
+        query = scope_col(scope, name)
+        if len(years) == 1:
+            return query.where("year", "==", years[0])
+        return query.where("year", ">=", years[0]).where("year", "<=", years[-1])
+
+    events, tasks = await asyncio.gather(stream_docs(in_years("events")), stream_docs(in_years("tasks")))
+
+    labels = {}
+
+    def bucketed(doc, day):
+        key, label = earnings_bucket(group_by, day, doc)
+        labels[key] = label
+        return {**doc, "_bucket": key}
+
+    selected_events = []
     for event in events:
-        try:
-            start_hour = int(event["start_time"].split(":")[0])
-            end_hour = int(event["end_time"].split(":")[0])
-            hours = end_hour - start_hour
-            amount = hours * event.get("hourly_rate", db_user.get("hourly_rate", 50.0))
-            
-            if event["status"] == "paid":
-                earnings["paid"] += amount
-            elif event["status"] == "unpaid":
-                earnings["unpaid"] += amount
-            elif event["status"] == "pending":
-                earnings["pending"] += amount
-            elif event["status"] == "not_worked":
-                earnings["not_worked"] += amount
-        except:
-            # Fallback calculation
-            amount = event.get("hourly_rate", db_user.get("hourly_rate", 50.0))
-            if event["status"] == "paid":
-                earnings["paid"] += amount
-            elif event["status"] == "unpaid":
-                earnings["unpaid"] += amount
-            elif event["status"] == "pending":
-                earnings["pending"] += amount
-    
-    # Add earnings from tasks - tasks are always considered as "paid"
+        day = planning_date(event, event.get("day"))
+        if day and start <= day <= end:
+            selected_events.append(bucketed(event, day))
+    selected_tasks = []
     for task in tasks:
         for time_slot in task.get("time_slots", []):
-            try:
-                start_hour = int(time_slot["start"].split(":")[0])
-                end_hour = int(time_slot["end"].split(":")[0])
-                hours = end_hour - start_hour
-                amount = hours * task.get("price", 0)  # task price is per hour
-                earnings["paid"] += amount
-            except:
-                # Fallback: add base task price
-                earnings["paid"] += task.get("price", 0)
-    
-    earnings["total"] = earnings["paid"] + earnings["unpaid"] + earnings["pending"]
-    
-    return earnings
+            day = planning_date(task, time_slot.get("day"))
+            if day and start <= day <= end:
+                selected_tasks.append(bucketed({**task, "time_slots": [time_slot]}, day))
+
+    def with_total(totals):
+        amounts = totals["amounts"]
+        return {**totals, "total": amounts["paid"] + amounts["unpaid"] + amounts["pending"]}
+
+    per_bucket = earnings_totals(selected_events, selected_tasks, key=lambda doc: doc["_bucket"])
+    buckets = [
+        {"key": key, "label": labels[key], **with_total(totals)}
+        for key, totals in sorted(per_bucket.items(), key=lambda item: (item[0] is None, str(labels[item[0]] or item[0])))
+    ]
+    overall = {"amounts": dict.fromkeys(EARNING_STATUSES, 0.0), "hours": dict.fromkeys(EARNING_STATUSES, 0.0)}
+    for totals in per_bucket.values():
+        for field in ("amounts", "hours"):
+            for status, value in totals[field].items():
+                overall[field][status] += value
+
+    return {
+        "from": start,
+        "to": end,
+        "group_by": group_by,
+        "buckets": buckets,
+        "totals": with_total(overall),
+    }
 
 # Tasks endpoints
 @api_router.get("/planning/tasks")
-async def list_tasks(year: Optional[int] = None, week: Optional[int] = None, user: Dict[str, Any] = Depends(verify_token)):
+async def list_tasks(year: Optional[int] = None, week: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
     tasks_ref = user_col(user["uid"], "tasks")
     if year is not None:
         tasks_ref = tasks_ref.where("year", "==", year)
     if week is not None:
         tasks_ref = tasks_ref.where("week", "==", week)
-    tasks = await stream_docs(tasks_ref)
-    return tasks
+    if limit is None and cursor is None:
+        return await stream_docs(tasks_ref)
+    return await list_page(tasks_ref, "created_at", firestore.Query.ASCENDING, limit, cursor)
 
 # Tasks endpoints
 @api_router.post("/planning/tasks")
-async def create_task(task_request: TaskCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def create_task(task_request: TaskCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     now = datetime.now()
     year = now.year
-    week = now.isocalendar()[1]
+    iso_year, week = now.isocalendar()[:2]
     
     task = WeeklyTask(
         uid=user["uid"],
         week=week,
         year=year,
+        iso_year=iso_year,
         **task_request.dict()
     )
-    await asyncio.to_thread(user_col(user["uid"], "tasks").document(task.id).set, task.dict())
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "tasks").document(task.id).set, task.dict())
+    team_id = profile.get("team_id") if profile else None
+    await write_planning(user["uid"], team_id, "tasks", "set", task.id, task.dict())
+    invalidate_week(user["uid"], team_id, task.year, task.week)
     return task
 
 @api_router.put("/planning/tasks/{task_id}")
-async def update_task(task_id: str, task_request: TaskCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def update_task(task_id: str, task_request: TaskCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     update_data = {**task_request.dict(), "updated_at": datetime.utcnow()}
-    await asyncio.to_thread(user_col(user["uid"], "tasks").document(task_id).update, update_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "tasks").document(task_id).update, update_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "tasks").document(task_id).get)
-    return updated.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    task = await write_planning(user["uid"], team_id, "tasks", "update", task_id, update_data)
+    invalidate_week(user["uid"], team_id, task.get("year"), task.get("week"))
+    return task
 
 @api_router.delete("/planning/tasks/{task_id}")
-async def delete_task(task_id: str, user: Dict[str, Any] = Depends(verify_token)):
+async def delete_task(task_id: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     doc_ref = user_col(user["uid"], "tasks").document(task_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+    snap = await doc_ref.get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Task not found")
-    await asyncio.to_thread(doc_ref.delete)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "tasks").document(task_id).delete)
+    team_id = profile.get("team_id") if profile else None
+    await write_planning(user["uid"], team_id, "tasks", "delete", task_id)
+    task = snap.to_dict()
+    invalidate_week(user["uid"], team_id, task.get("year"), task.get("week"))
     return {"message": "Task deleted"}
 
 @api_router.get("/todos")
-async def get_todos(user: Dict[str, Any] = Depends(verify_token)):
-    todos = await stream_docs(
-        user_col(user["uid"], "todos").order_by("created_at", direction=firestore.Query.DESCENDING)
-    )
-    return todos
+async def get_todos(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    return await list_page(user_col(user["uid"], "todos"), "created_at", firestore.Query.DESCENDING, limit, cursor)
 
 @api_router.post("/todos")
 async def create_todo(todo_request: TodoCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
@@ -575,7 +1184,7 @@ async def create_todo(todo_request: TodoCreateRequest, user: Dict[str, Any] = De
         **todo_data
     )
     
-    await asyncio.to_thread(user_col(user["uid"], "todos").document(todo.id).set, todo.dict())
+    await write_mirrored(user["uid"], None, "todos", [("set", todo.id, todo.dict())])
     return todo
 
 @api_router.put("/todos/{todo_id}")
@@ -585,37 +1194,39 @@ async def update_todo(todo_id: str, todo_request: TodoCreateRequest, user: Dict[
         todo_data["due_date"] = datetime.fromisoformat(todo_data["due_date"].replace("Z", "+00:00"))
     
     update_data = {**todo_data, "updated_at": datetime.utcnow()}
-    await asyncio.to_thread(user_col(user["uid"], "todos").document(todo_id).update, update_data)
-    snap = await asyncio.to_thread(user_col(user["uid"], "todos").document(todo_id).get)
+    await write_mirrored(user["uid"], None, "todos", [("update", todo_id, update_data)])
+    snap = await user_col(user["uid"], "todos").document(todo_id).get()
     return snap.to_dict()
 
 @api_router.put("/todos/{todo_id}/toggle")
 async def toggle_todo(todo_id: str, user: Dict[str, Any] = Depends(verify_token)):
     doc_ref = user_col(user["uid"], "todos").document(todo_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+    snap = await doc_ref.get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Todo not found")
     data = snap.to_dict()
-    await asyncio.to_thread(doc_ref.update, {"completed": not data.get("completed", False), "updated_at": datetime.utcnow()})
-    updated = await asyncio.to_thread(doc_ref.get)
+    await write_mirrored(user["uid"], None, "todos", [
+        ("update", todo_id, {"completed": not data.get("completed", False), "updated_at": datetime.utcnow()})
+    ])
+    updated = await doc_ref.get()
     return updated.to_dict()
 
 @api_router.delete("/todos/{todo_id}")
 async def delete_todo(todo_id: str, user: Dict[str, Any] = Depends(verify_token)):
     doc_ref = user_col(user["uid"], "todos").document(todo_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+    snap = await doc_ref.get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Todo not found")
-    await asyncio.to_thread(doc_ref.delete)
+    await write_mirrored(user["uid"], None, "todos", [("delete", todo_id, None)])
     return {"message": "Todo deleted"}
 
 # Clients endpoints
 @api_router.get("/clients")
-async def get_clients(user: Dict[str, Any] = Depends(verify_token)):
-    clients = await stream_docs(
-        user_col(user["uid"], "clients").order_by("name")
-    )
-    return clients
+async def get_clients(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    not_modified = await check_etag(request, response, ("users", user["uid"]), ("clients",), limit, cursor)
+    if not_modified:
+        return not_modified
+    return await list_page(user_col(user["uid"], "clients"), "name", firestore.Query.ASCENDING, limit, cursor)
 
 @api_router.post("/clients")
 async def create_client(client_request: ClientCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
@@ -624,39 +1235,136 @@ async def create_client(client_request: ClientCreateRequest, user: Dict[str, Any
         **client_request.dict()
     )
     
-    await asyncio.to_thread(user_col(user["uid"], "clients").document(client.id).set, client.dict())
+    await write_mirrored(user["uid"], None, "clients", [("set", client.id, client.dict())])
     return client
 
 @api_router.put("/clients/{client_id}")
 async def update_client(client_id: str, client_request: ClientCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
     update_data = {**client_request.dict(), "updated_at": datetime.utcnow()}
     doc_ref = user_col(user["uid"], "clients").document(client_id)
-    await asyncio.to_thread(doc_ref.update, update_data)
-    updated = await asyncio.to_thread(doc_ref.get)
+    await write_mirrored(user["uid"], None, "clients", [("update", client_id, update_data)])
+    updated = await doc_ref.get()
     return updated.to_dict()
 
 @api_router.delete("/clients/{client_id}")
 async def delete_client(client_id: str, user: Dict[str, Any] = Depends(verify_token)):
     doc_ref = user_col(user["uid"], "clients").document(client_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+    snap = await doc_ref.get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Client not found")
-    await asyncio.to_thread(doc_ref.delete)
+    await write_mirrored(user["uid"], None, "clients", [("delete", client_id, None)])
     return {"message": "Client deleted"}
 
+# Revenue summary: per-status counts and totals of a user's invoices and
+# quotes, kept in users/{uid}/meta/revenue and moved by delta in the same
+# transaction as every quote or invoice write.
+PAID_INVOICE_STATUSES = ("paid",)
+UNPAID_INVOICE_STATUSES = ("sent", "overdue")
+PENDING_QUOTE_STATUSES = ("draft", "sent", "accepted")
+
+
+def revenue_ref(uid: str):
+    return user_col(uid, "meta").document("revenue")
+
+
+def apply_revenue_delta(summary: Dict[str, Any], name: str, doc: Optional[Dict[str, Any]], sign: int):
+    if not doc:
+        return
+    bucket = summary[name].setdefault(doc.get("status") or "unknown", {"count": 0, "total": 0.0})
+    bucket["count"] += sign
+    bucket["total"] += sign * float(doc.get("total") or 0)
+
+
+def copy_revenue_summary(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    data = data or {}
+    return {
+        name: {status: dict(bucket) for status, bucket in (data.get(name) or {}).items()}
+        for name in ("invoices", "quotes")
+    }
+
+
+def revenue_totals(summary: Dict[str, Any]) -> Dict[str, Any]:
+    def buckets(name, statuses):
+        return [summary.get(name, {}).get(status, {}) for status in statuses]
+
+    def total(name, statuses):
+        return float(sum(b.get("total", 0.0) for b in buckets(name, statuses)))
+
+    return {
+        "paid": total("invoices", PAID_INVOICE_STATUSES),
+        "unpaid": total("invoices", UNPAID_INVOICE_STATUSES),
+        "pending": total("quotes", PENDING_QUOTE_STATUSES),
+        "unpaid_invoices_count": sum(b.get("count", 0) for b in buckets("invoices", UNPAID_INVOICE_STATUSES)),
+    }
+
+
+async def rebuild_revenue_summary(uid: str, bump_version: bool = True) -> Dict[str, Any]:
+    """Recompute the revenue summary from scratch, repairing any drift.
+
+    A repair may change the dashboard's totals, so it bumps the version
+    token behind its ETag. Building a missing summary changes nothing a
+    client has seen and passes ``bump_version=False``.
+    """
+    summary_ref = revenue_ref(uid)
+
+    async def rebuild(transaction):
+        summary = copy_revenue_summary(None)
+        for name in ("invoices", "quotes"):
+            async for snap in user_col(uid, name).stream(transaction=transaction):
+                apply_revenue_delta(summary, name, snap.to_dict(), 1)
+        summary["updated_at"] = datetime.utcnow()
+        transaction.set(summary_ref, summary)
+        if bump_version:
+            stage_version_bump(transaction, [("users", uid)], "invoices")
+        return summary
+
+    return await run_transaction(db, rebuild)
+
+
+async def load_revenue_summary(uid: str) -> Dict[str, Any]:
+    snap = await revenue_ref(uid).get()
+    if snap.exists:
+        return snap.to_dict()
+    # The ETag of the response being built was derived before this read.
+    return await rebuild_revenue_summary(uid, bump_version=False)
+
+
+async def revenue_delta(transaction, name: str, changes):
+    """Fold a quote or invoice change into the owner's revenue summary.
+
+    Without a summary there is nothing to adjust; the next dashboard read
+    rebuilds it from the collections.
+    """
+    (kind, uid), before, after = changes[0]
+    summary_ref = revenue_ref(uid)
+    snap = await summary_ref.get(transaction=transaction)
+    if not snap.exists:
+        return []
+    summary = copy_revenue_summary(snap.to_dict())
+    apply_revenue_delta(summary, name, before, -1)
+    apply_revenue_delta(summary, name, after, 1)
+    summary["updated_at"] = datetime.utcnow()
+    return [(summary_ref, summary)]
+
+
+async def write_billing(uid: str, team_id: Optional[str], name: str, op: str, doc_id: str, data=None):
+    """Apply one quote or invoice mutation and fold it into the revenue summary."""
+    return await write_tracked(uid, team_id, name, op, doc_id, data, revenue_delta)
+
+
+@api_router.post("/revenue/rebuild")
+async def rebuild_revenue(user: Dict[str, Any] = Depends(verify_token)):
+    summary = await rebuild_revenue_summary(user["uid"])
+    return revenue_totals(summary)
+
 # Quotes endpoints
 @api_router.get("/quotes")
-async def get_quotes(user: Dict[str, Any] = Depends(verify_token)):
-    quotes = await stream_docs(
-        user_col(user["uid"], "quotes").order_by("created_at", direction=firestore.Query.DESCENDING)
-    )
-    return quotes
+async def get_quotes(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    return await list_page(user_col(user["uid"], "quotes"), "created_at", firestore.Query.DESCENDING, limit, cursor)
 
 @api_router.post("/quotes")
-async def create_quote(quote_request: QuoteCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
-    # Generate quote number
-    quote_count = len(await stream_docs(user_col(user["uid"], "quotes")))
-    quote_number = f"DEV-{datetime.now().year}-{quote_count + 1:04d}"
+async def create_quote(quote_request: QuoteCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
+    quote_number = await next_document_number(user["uid"], "quotes")
     
     quote_data = quote_request.dict()
     quote_data["quote_number"] = quote_number
@@ -678,15 +1386,12 @@ async def create_quote(quote_request: QuoteCreateRequest, user: Dict[str, Any] =
         **quote_data
     )
     
-    await asyncio.to_thread(user_col(user["uid"], "quotes").document(quote.id).set, quote.dict())
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "quotes").document(quote.id).set, quote.dict())
+    team_id = profile.get("team_id") if profile else None
+    await write_billing(user["uid"], team_id, "quotes", "set", quote.id, quote.dict())
     return quote
 
 @api_router.put("/quotes/{quote_id}")
-async def update_quote(quote_id: str, quote_request: QuoteCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def update_quote(quote_id: str, quote_request: QuoteCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     quote_data = quote_request.dict()
     quote_data["valid_until"] = datetime.fromisoformat(quote_data["valid_until"].replace("Z", "+00:00"))
     
@@ -702,59 +1407,98 @@ async def update_quote(quote_id: str, quote_request: QuoteCreateRequest, user: D
         "updated_at": datetime.utcnow()
     })
     
-    await asyncio.to_thread(user_col(user["uid"], "quotes").document(quote_id).update, quote_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "quotes").document(quote_id).update, quote_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "quotes").document(quote_id).get)
-    return updated.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    return await write_billing(user["uid"], team_id, "quotes", "update", quote_id, quote_data)
 
 @api_router.delete("/quotes/{quote_id}")
-async def delete_quote(quote_id: str, user: Dict[str, Any] = Depends(verify_token)):
-    doc_ref = user_col(user["uid"], "quotes").document(quote_id)
-    snap = await asyncio.to_thread(doc_ref.get)
-    if not snap.exists:
-        raise HTTPException(status_code=404, detail="Quote not found")
-    await asyncio.to_thread(doc_ref.delete)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "quotes").document(quote_id).delete)
+async def delete_quote(quote_id: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
+    team_id = profile.get("team_id") if profile else None
+    await write_billing(user["uid"], team_id, "quotes", "delete", quote_id)
     return {"message": "Quote deleted"}
 
-#@api_router.get("/quotes/{quote_id}/pdf")
-#async def get_quote_pdf(quote_id: str, current_user: User = Depends(get_current_user)):
-    #quote = await db.quotes.find_one({"id": quote_id, "uid": current_user.uid}, {"_id": 0})
-    #if not quote:
-        #raise HTTPException(status_code=404, detail="Quote not found")
-    #pdf_bytes = await quote_pdf_bytes(quote)
-    #return Response(content=pdf_bytes, media_type="application/pdf")
+async def pdf_response(request: Request, kind: str, document: Dict[str, Any], filename: str, team_id: Optional[str]) -> Response:
+    """Serve a rendered PDF from the disk cache with a content-derived ETag."""
+    etag = f'"{PDFCache.key(kind, document, team_id)}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'inline; filename="{filename}.pdf"',
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        _, path = await cached_pdf(kind, document, team_id)
+    except PDFRenderBusy:
+        raise HTTPException(status_code=503, detail="PDF renderer is busy", headers={"Retry-After": "5"})
+    except PDFRenderTimeout:
+        raise HTTPException(status_code=504, detail="PDF rendering timed out")
+    except PDFRenderError:
+        raise HTTPException(status_code=503, detail="PDF renderer is unavailable")
+    return FileResponse(path, media_type="application/pdf", headers=headers)
+
+@api_router.get("/quotes/{quote_id}/pdf")
+async def get_quote_pdf(quote_id: str, request: Request, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_user_profile)):
+    snap = await user_col(user["uid"], "quotes").document(quote_id).get()
+    if not snap.exists:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    quote = snap.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    return await pdf_response(request, "quote", quote, quote.get("quote_number") or quote_id, team_id)
 
 @api_router.put("/quotes/{quote_id}/status")
-async def update_quote_status(quote_id: str, status: str, user: Dict[str, Any] = Depends(verify_token)):
+async def update_quote_status(quote_id: str, status: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     update_data = {"status": status, "updated_at": datetime.utcnow()}
-    await asyncio.to_thread(user_col(user["uid"], "quotes").document(quote_id).update, update_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "quotes").document(quote_id).update, update_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "quotes").document(quote_id).get)
-    return updated.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    return await write_billing(user["uid"], team_id, "quotes", "update", quote_id, update_data)
 
 # Invoices endpoints
 @api_router.get("/invoices")
-async def get_invoices(user: Dict[str, Any] = Depends(verify_token)):
-    invoices = await stream_docs(
-        user_col(user["uid"], "invoices").order_by("created_at", direction=firestore.Query.DESCENDING)
+async def get_invoices(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, user: Dict[str, Any] = Depends(verify_token)):
+    not_modified = await check_etag(request, response, ("users", user["uid"]), ("invoices",), limit, cursor)
+    if not_modified:
+        return not_modified
+    return await list_page(user_col(user["uid"], "invoices"), "created_at", firestore.Query.DESCENDING, limit, cursor)
+
+PDF_EXPORT_CONCURRENCY = int(os.environ.get("PDF_EXPORT_CONCURRENCY", "4"))
+
+
+@api_router.get("/invoices/export.zip")
+async def export_invoices_zip(
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    user: Dict[str, Any] = Depends(verify_token),
+    profile: Optional[Dict[str, Any]] = Depends(get_user_profile),
+):
+    """Stream a ZIP of the PDFs of every invoice created between two dates (inclusive)."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    team_id = profile.get("team_id") if profile else None
+    return StreamingResponse(
+        invoice_archive(user["uid"], start, end, team_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="invoices-{start}-{end}.zip"'},
+    )
+
+
+def invoice_archive(uid: str, start: date, end: date, team_id: Optional[str]):
+    query = (
+        user_col(uid, "invoices")
+        .where("created_at", ">=", datetime(start.year, start.month, start.day))
+        .where("created_at", "<", datetime(end.year, end.month, end.day) + timedelta(days=1))
+        .order_by("created_at")
+    )
+    invoices = (snap.to_dict() async for snap in query.stream())
+    return stream_pdf_zip(
+        "invoice",
+        invoices,
+        lambda invoice: invoice.get("invoice_number") or invoice["id"],
+        concurrency=PDF_EXPORT_CONCURRENCY,
+        team_id=team_id,
     )
-    return invoices
 
 @api_router.post("/invoices")
-async def create_invoice(invoice_request: InvoiceCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
-    # Generate invoice number
-    invoice_count = len(await stream_docs(user_col(user["uid"], "invoices")))
-    invoice_number = f"FACT-{datetime.now().year}-{invoice_count + 1:04d}"
+async def create_invoice(invoice_request: InvoiceCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
+    invoice_number = await next_document_number(user["uid"], "invoices")
     
     invoice_data = invoice_request.dict()
     invoice_data["invoice_number"] = invoice_number
@@ -776,15 +1520,12 @@ async def create_invoice(invoice_request: InvoiceCreateRequest, user: Dict[str,
         **invoice_data
     )
     
-    await asyncio.to_thread(user_col(user["uid"], "invoices").document(invoice.id).set, invoice.dict())
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "invoices").document(invoice.id).set, invoice.dict())
+    team_id = profile.get("team_id") if profile else None
+    await write_billing(user["uid"], team_id, "invoices", "set", invoice.id, invoice.dict())
     return invoice
 
 @api_router.put("/invoices/{invoice_id}")
-async def update_invoice(invoice_id: str, invoice_request: InvoiceCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+async def update_invoice(invoice_id: str, invoice_request: InvoiceCreateRequest, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     invoice_data = invoice_request.dict()
     invoice_data["due_date"] = datetime.fromisoformat(invoice_data["due_date"].replace("Z", "+00:00"))
 
@@ -799,50 +1540,70 @@ async def update_invoice(invoice_id: str, invoice_request: InvoiceCreateRequest,
         "updated_at": datetime.utcnow(),
     })
 
-    await asyncio.to_thread(user_col(user["uid"], "invoices").document(invoice_id).update, invoice_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "invoices").document(invoice_id).update, invoice_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "invoices").document(invoice_id).get)
-    return updated.to_dict()
-
-#@api_router.get("/invoices/{invoice_id}/pdf")
-#async def get_invoice_pdf(invoice_id: str, current_user: User = Depends(get_current_user)):
-#    invoice = await db.invoices.find_one({"id": invoice_id, "uid": current_user.uid}, {"_id": 0})
- #   if not invoice:
-  #      raise HTTPException(status_code=404, detail="Invoice not found")
-   # pdf_bytes = await invoice_pdf_bytes(invoice)
-    #return Response(content=pdf_bytes, media_type="application/pdf")
+    team_id = profile.get("team_id") if profile else None
+    return await write_billing(user["uid"], team_id, "invoices", "update", invoice_id, invoice_data)
 
-@api_router.delete("/invoices/{invoice_id}")
-async def delete_invoice(invoice_id: str, user: Dict[str, Any] = Depends(verify_token)):
-    doc_ref = user_col(user["uid"], "invoices").document(invoice_id)
-    snap = await asyncio.to_thread(doc_ref.get)
+@api_router.get("/invoices/{invoice_id}/pdf")
+async def get_invoice_pdf(invoice_id: str, request: Request, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_user_profile)):
+    snap = await user_col(user["uid"], "invoices").document(invoice_id).get()
     if not snap.exists:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    await asyncio.to_thread(doc_ref.delete)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "invoices").document(invoice_id).delete)
+    invoice = snap.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    return await pdf_response(request, "invoice", invoice, invoice.get("invoice_number") or invoice_id, team_id)
+
+@api_router.delete("/invoices/{invoice_id}")
+async def delete_invoice(invoice_id: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
+    team_id = profile.get("team_id") if profile else None
+    await write_billing(user["uid"], team_id, "invoices", "delete", invoice_id)
     return {"message": "Invoice deleted"}
 
 @api_router.put("/invoices/{invoice_id}/status")
-async def update_invoice_status(invoice_id: str, status: str, user: Dict[str, Any] = Depends(verify_token)):
+async def update_invoice_status(invoice_id: str, status: str, user: Dict[str, Any] = Depends(verify_token), profile: Optional[Dict[str, Any]] = Depends(get_fresh_user_profile)):
     update_data = {"status": status, "updated_at": datetime.utcnow()}
     if status == "paid":
         update_data["paid_date"] = datetime.utcnow()
     
-    await asyncio.to_thread(user_col(user["uid"], "invoices").document(invoice_id).update, update_data)
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    team_id = user_snap.to_dict().get("team_id") if user_snap.exists else None
-    if team_id:
-        await asyncio.to_thread(team_col(team_id, "invoices").document(invoice_id).update, update_data)
-    updated = await asyncio.to_thread(user_col(user["uid"], "invoices").document(invoice_id).get)
-    return updated.to_dict()
+    team_id = profile.get("team_id") if profile else None
+    return await write_billing(user["uid"], team_id, "invoices", "update", invoice_id, update_data)
 
 # Teams endpoints
+TEAM_ROSTER_CHUNK = 100
+team_roster_cache = LRUCache(
+    maxsize=int(os.environ.get("TEAM_ROSTER_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("TEAM_ROSTER_CACHE_TTL", "60")),
+)
+
+
+async def load_team_roster(team_id: str, member_uids: List[str]) -> List[Dict[str, Any]]:
+    """Return ``uid``/``name``/``email`` for each member, in team order.
+
+    Profiles are read with multi-document ``get_all`` calls, in concurrent
+    chunks of ``TEAM_ROSTER_CHUNK``. The roster is cached per team and is
+    reloaded when the member list differs from the cached one.
+    """
+    key = tuple(member_uids)
+    cached = team_roster_cache.get(team_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    async def fetch(uids):
+        refs = [db.collection("users").document(uid) for uid in uids]
+        return [snap.to_dict() async for snap in db.get_all(refs) if snap.exists]
+
+    chunks = await asyncio.gather(*(
+        fetch(member_uids[i:i + TEAM_ROSTER_CHUNK])
+        for i in range(0, len(member_uids), TEAM_ROSTER_CHUNK)
+    ))
+    profiles = {p["uid"]: p for chunk in chunks for p in chunk if p and p.get("uid")}
+    roster = [
+        {"uid": uid, "name": profiles[uid]["name"], "email": profiles[uid]["email"]}
+        for uid in member_uids
+        if uid in profiles
+    ]
+    team_roster_cache.set(team_id, (key, roster))
+    return roster
+
 @api_router.post("/teams")
 async def create_team(team_request: TeamCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
     team = Team(
@@ -851,31 +1612,26 @@ async def create_team(team_request: TeamCreateRequest, user: Dict[str, Any] = De
         created_by=user["uid"]
     )
 
-    await asyncio.to_thread(db.collection("teams").document(team.team_id).set, team.dict())
-    await asyncio.to_thread(user_doc(user["uid"]).update, {"team_id": team.team_id})
+    await db.collection("teams").document(team.team_id).set(team.dict())
+    await user_doc(user["uid"]).update({"team_id": team.team_id})
+    await bump_versions(("users", user["uid"]), "profile")
+    profile_cache.pop(user["uid"])
+    team_roster_cache.pop(team.team_id)
     
     return team
 
 @api_router.get("/teams/my")
-async def get_my_team(user: Dict[str, Any] = Depends(verify_token)):
-    user_snap = await asyncio.to_thread(user_doc(user["uid"]).get)
-    db_user = user_snap.to_dict() if user_snap.exists else None
+async def get_my_team(db_user: Optional[Dict[str, Any]] = Depends(get_user_profile)):
     if not db_user or not db_user.get("team_id"):
         return None
 
-    team_snap = await asyncio.to_thread(db.collection("teams").document(db_user["team_id"]).get)
+    team_snap = await db.collection("teams").document(db_user["team_id"]).get()
     team = team_snap.to_dict() if team_snap.exists else None
     if not team:
         return None
     
-    # Get team members info
-    members = []
-    for member_uid in team["members"]:
-        snap = await asyncio.to_thread(db.collection("users").document(member_uid).get)
-        member = snap.to_dict() if snap.exists else None
-        if member:
-            members.append({"uid": member["uid"], "name": member["name"], "email": member["email"]})
-    
+    members = await load_team_roster(team["team_id"], team["members"])
+
     return {
         "team_id": team["team_id"],
         "name": team["name"],
@@ -884,6 +1640,102 @@ async def get_my_team(user: Dict[str, Any] = Depends(verify_token)):
         "created_by": team["created_by"]
     }
 
+# Background jobs
+job_queue = JobQueue.from_env(db, run_transaction)
+
+
+def job_concurrency(job_type: str, default: int) -> int:
+    return int(os.environ.get(f"JOB_CONCURRENCY_{job_type.upper()}", str(default)))
+
+
+def validate_date_range(params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        start = date.fromisoformat(str(params["from"]))
+        end = date.fromisoformat(str(params["to"]))
+    except (KeyError, ValueError):
+        raise ValueError("'from' and 'to' must be ISO dates")
+    if end < start:
+        raise ValueError("'to' must not be before 'from'")
+    return {"from": start.isoformat(), "to": end.isoformat()}
+
+
+async def invoice_export_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    uid = job["owner"]
+    start, end = date.fromisoformat(job["params"]["from"]), date.fromisoformat(job["params"]["to"])
+    profile = await user_doc(uid).get()
+    team_id = profile.to_dict().get("team_id") if profile.exists else None
+
+    stored = await job_queue.store_result(job["id"], invoice_archive(uid, start, end, team_id))
+    return {
+        **stored,
+        "media_type": "application/zip",
+        "filename": f"invoices-{start}-{end}.zip",
+    }
+
+
+async def earnings_backfill_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {"weeks": await backfill_earnings_rollups(("users", job["owner"]))}
+
+
+async def revenue_rebuild_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return revenue_totals(await rebuild_revenue_summary(job["owner"]))
+
+
+job_queue.register(
+    "invoice_export", invoice_export_job,
+    concurrency=job_concurrency("invoice_export", 1), validate=validate_date_range,
+)
+job_queue.register("earnings_backfill", earnings_backfill_job, concurrency=job_concurrency("earnings_backfill", 2))
+job_queue.register("revenue_rebuild", revenue_rebuild_job, concurrency=job_concurrency("revenue_rebuild", 2))
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in job.items() if k not in ("instance", "lease_until")}
+
+
+async def owned_job(job_id: str, uid: str) -> Dict[str, Any]:
+    job = await job_queue.get(job_id)
+    if not job or job.get("owner") != uid:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@api_router.post("/jobs", status_code=202)
+async def create_job(job_request: JobCreateRequest, user: Dict[str, Any] = Depends(verify_token)):
+    try:
+        job = await job_queue.submit(job_request.type, job_request.params, owner=user["uid"])
+    except JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return public_job(job)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user: Dict[str, Any] = Depends(verify_token)):
+    return public_job(await owned_job(job_id, user["uid"]))
+
+@api_router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, user: Dict[str, Any] = Depends(verify_token)):
+    job = await owned_job(job_id, user["uid"])
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    result = job.get("result")
+    if isinstance(result, dict) and result.get("chunks"):
+        if not await job_queue.has_result(job_id, result["chunks"]):
+            raise HTTPException(status_code=410, detail="Job result is no longer available")
+        return StreamingResponse(
+            job_queue.read_result(job_id, result["chunks"]),
+            media_type=result.get("media_type"),
+            headers={
+                "Content-Disposition": f'attachment; filename="{result.get("filename")}"',
+                "Content-Length": str(result["size"]),
+            },
+        )
+    return result
+
+@api_router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, user: Dict[str, Any] = Depends(verify_token)):
+    await owned_job(job_id, user["uid"])
+    return public_job(await job_queue.cancel(job_id))
+
 # Health check route
 @api_router.get("/ping")
 async def ping():
@@ -891,7 +1743,7 @@ async def ping():
         return {"status": "error", "message": "running in mock mode"}
     try:
         test_ref = db.collection("_ping").document("ping")
-        await asyncio.to_thread(test_ref.set, {"ok": True})
+        await test_ref.set({"ok": True})
         return {"status": "ok"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -900,10 +1752,27 @@ async def ping():
 @api_router.get("/test-firestore")
 async def test_firestore():
     test_ref = db.collection("test").document("ping")
-    await asyncio.to_thread(test_ref.set, {"hello": "world"})
-    snap = await asyncio.to_thread(test_ref.get)
+    await test_ref.set({"hello": "world"})
+    snap = await test_ref.get()
     return snap.to_dict()
 
+# Cache metrics route, only registered when CACHE_METRICS_ENABLED=true
+CACHE_METRICS_ENABLED = os.environ.get("CACHE_METRICS_ENABLED", "false").lower() == "true"
+
+
+async def cache_metrics(user: Dict[str, Any] = Depends(verify_token)):
+    return {
+        "token_cache": token_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "team_roster_cache": team_roster_cache.stats(),
+        "week_cache": week_cache.stats(),
+        "pdf_cache": pdf_cache.stats(),
+    }
+
+
+if CACHE_METRICS_ENABLED:
+    api_router.add_api_route("/metrics/cache", cache_metrics, methods=["GET"])
+
 # Basic test route
 @api_router.get("/")
 async def root():
@@ -912,6 +1781,27 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+
+@app.on_event("startup")
+async def start_pdf_renderer():
+    await pdf_renderer.start()
+
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+
+@app.on_event("shutdown")
+async def stop_pdf_renderer():
+    pdf_renderer.close()
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -0,0 +1,456 @@
+"""SQLite implementation of the async Firestore client interface.
+
+Selected with ``STORAGE_BACKEND=sqlite``. Endpoints keep using the same
+``collection``/``document``/``where``/``batch``/``transaction`` calls they
+use against Firestore, but documents live in a single SQLite file. That is
+enough for realistic local datasets and for small single-node deployments.
+
+Documents are stored as JSON in one table keyed by (collection path, id).
+Filters, ordering, cursors and count()/sum() aggregations are translated to
+SQL over ``json_extract`` expressions. The fields the API filters and sorts
+on have matching expression indexes. The database runs in WAL mode, and
+statements are parameterized so sqlite3's statement cache reuses compiled
+plans. ``SQLiteFirestore.explain(query)`` returns SQLite's query plan for
+any query.
+
+Calls run synchronously on the event loop thread. That is fine for the
+sub-millisecond indexed lookups this backend is meant for; use Firestore
+for anything larger.
+"""
+import asyncio
+import base64
+import json
+import re
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+) WITHOUT ROWID;
+"""
+
+# Fields the API filters or sorts on; each gets an expression index.
+INDEXED_FIELDS = (
+    ("year", "week"),
+    ("created_at",),
+    ("status",),
+    ("name",),
+    ("completed",),
+    ("quote_number",),
+    ("invoice_number",),
+)
+
+_FIELD_PATH = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+# Datetimes are stored as tagged, fixed-width UTC strings so that they
+# compare correctly in SQL and can be restored on read.
+_DATETIME_TAG = "\ue000dt:"
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+# Bytes are stored as tagged base64 strings for the same reason.
+_BYTES_TAG = "\ue000b64:"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return _DATETIME_TAG + value.strftime(_DATETIME_FORMAT)
+    if isinstance(value, (bytes, bytearray)):
+        return _BYTES_TAG + base64.b64encode(value).decode("ascii")
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(_DATETIME_TAG):
+        return datetime.strptime(value[len(_DATETIME_TAG):], _DATETIME_FORMAT)
+    if isinstance(value, str) and value.startswith(_BYTES_TAG):
+        return base64.b64decode(value[len(_BYTES_TAG):])
+    if isinstance(value, dict):
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _param(value):
+    """Encode a filter value the way ``json_extract`` reports stored values."""
+    value = _encode(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _dumps(data):
+    return json.dumps(_encode(data), separators=(",", ":"))
+
+
+def _loads(text):
+    return _decode(json.loads(text))
+
+
+def _json_path(field_path):
+    if not _FIELD_PATH.match(field_path):
+        raise ValueError(f"Unsupported field path: {field_path!r}")
+    return f"'$.{field_path}'"
+
+
+def _extract(field_path):
+    return f"json_extract(data, {_json_path(field_path)})"
+
+
+class SQLiteSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return self._data
+
+    def get(self, field_path):
+        value = self._data or {}
+        for part in field_path.split("."):
+            value = value[part]
+        return value
+
+
+class SQLiteAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class SQLiteAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(("count", None, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def sum(self, field, alias=None):
+        self._aggregations.append(("sum", field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    async def get(self, transaction=None):
+        columns = []
+        for kind, field, _ in self._aggregations:
+            if kind == "count":
+                columns.append("COUNT(*)")
+            else:
+                path = _json_path(field)
+                columns.append(
+                    f"COALESCE(SUM(CASE WHEN json_type(data, {path}) IN ('integer', 'real') "
+                    f"THEN json_extract(data, {path}) END), 0)"
+                )
+        inner, params = self._query._select_sql("data")
+        row = self._query._client._conn.execute(
+            f"SELECT {', '.join(columns)} FROM ({inner})", params
+        ).fetchone()
+        return [[
+            SQLiteAggregationResult(alias, value)
+            for (_, _, alias), value in zip(self._aggregations, row)
+        ]]
+
+
+class SQLiteQuery:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, collection, filters=(), orders=(), limit=None, cursor=None):
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    @property
+    def _client(self):
+        return self._collection._client
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return SQLiteQuery(self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        _json_path(field_path)
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        _json_path(field_path)
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(cursor=(document_fields_or_snapshot, True))
+
+    def count(self, alias=None):
+        return SQLiteAggregationQuery(self).count(alias=alias)
+
+    def sum(self, field, alias=None):
+        return SQLiteAggregationQuery(self).sum(field, alias=alias)
+
+    def _filter_sql(self, field_path, op, value):
+        column = _extract(field_path)
+        path = _json_path(field_path)
+        if op == "==":
+            if value is None:
+                return f"json_type(data, {path}) = 'null'", []
+            return f"{column} = ?", [_param(value)]
+        if op == "!=":
+            return f"{column} IS NOT NULL AND {column} != ?", [_param(value)]
+        if op in ("<", "<=", ">", ">="):
+            return f"{column} {op} ?", [_param(value)]
+        if op in ("in", "not-in"):
+            values = [_param(v) for v in value]
+            placeholders = ", ".join("?" * len(values)) or "NULL"
+            if op == "in":
+                return f"{column} IN ({placeholders})", values
+            return f"{column} IS NOT NULL AND {column} NOT IN ({placeholders})", values
+        if op == "array-contains":
+            return f"EXISTS (SELECT 1 FROM json_each(data, {path}) WHERE value = ?)", [_param(value)]
+        if op == "array-contains-any":
+            values = [_param(v) for v in value]
+            placeholders = ", ".join("?" * len(values)) or "NULL"
+            return f"EXISTS (SELECT 1 FROM json_each(data, {path}) WHERE value IN ({placeholders}))", values
+        raise ValueError(f"Unsupported filter operator: {op}")
+
+    def _cursor_sql(self):
+        values, inclusive = self._cursor
+        if hasattr(values, "to_dict"):
+            values = values.to_dict()
+        # (a > ?) OR (a = ? AND b > ?) OR ..., flipping the comparison per
+        # descending key; start_at also accepts the exact cursor position.
+        clauses, params = [], []
+        for i, (field, direction) in enumerate(self._orders):
+            parts = []
+            for prev_field, _ in self._orders[:i]:
+                parts.append(f"{_extract(prev_field)} = ?")
+                params.append(_param(values[prev_field]))
+            op = "<" if direction == self.DESCENDING else ">"
+            parts.append(f"{_extract(field)} {op} ?")
+            params.append(_param(values[field]))
+            clauses.append("(" + " AND ".join(parts) + ")")
+        if inclusive:
+            clauses.append("(" + " AND ".join(f"{_extract(f)} = ?" for f, _ in self._orders) + ")")
+            params.extend(_param(values[f]) for f, _ in self._orders)
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def _select_sql(self, columns):
+        conditions = ["collection = ?"]
+        params = [self._collection._key]
+        for field_path, op, value in self._filters:
+            clause, values = self._filter_sql(field_path, op, value)
+            conditions.append(clause)
+            params.extend(values)
+        for field_path, _ in self._orders:
+            # Firestore excludes documents that lack an ordered field.
+            conditions.append(f"json_type(data, {_json_path(field_path)}) IS NOT NULL")
+        if self._cursor is not None and self._orders:
+            clause, values = self._cursor_sql()
+            conditions.append(clause)
+            params.extend(values)
+        order = ", ".join(
+            f"{_extract(field)} {'DESC' if direction == self.DESCENDING else 'ASC'}"
+            for field, direction in self._orders
+        )
+        sql = f"SELECT {columns} FROM documents WHERE {' AND '.join(conditions)}"
+        sql += f" ORDER BY {order + ', ' if order else ''}doc_id"
+        if self._limit is not None:
+            sql += " LIMIT ?"
+            params.append(self._limit)
+        return sql, params
+
+    async def stream(self, transaction=None):
+        sql, params = self._select_sql("doc_id, data")
+        rows = self._client._conn.execute(sql, params).fetchall()
+        collection = self._collection
+        for doc_id, data in rows:
+            yield SQLiteSnapshot(collection.document(doc_id), _loads(data))
+
+
+class SQLiteDocument:
+    def __init__(self, client, path):
+        self._client = client
+        self._path = tuple(path)
+        self.id = self._path[-1]
+        self._collection_key = "/".join(self._path[:-1])
+
+    @property
+    def path(self):
+        return "/".join(self._path)
+
+    @property
+    def parent(self):
+        return SQLiteCollection(self._client, self._path[:-1])
+
+    def collection(self, name):
+        return SQLiteCollection(self._client, self._path + (name,))
+
+    def _read(self):
+        row = self._client._conn.execute(
+            "SELECT data FROM documents WHERE collection = ? AND doc_id = ?",
+            (self._collection_key, self.id),
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def _write_sql(self, op, data):
+        """Return the statement applying ``op``; reads the current data for updates."""
+        if op == "delete":
+            return (
+                "DELETE FROM documents WHERE collection = ? AND doc_id = ?",
+                (self._collection_key, self.id),
+            )
+        if op in ("update", "merge"):
+            current = self._read()
+            if current is None and op == "update":
+                raise KeyError(f"No document to update: {self.path}")
+            data = {**(current or {}), **data}
+        return (
+            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+            (self._collection_key, self.id, _dumps(data)),
+        )
+
+    async def set(self, data, merge=False):
+        self._client._execute_writes([(self, "merge" if merge else "set", data)])
+
+    async def update(self, data):
+        self._client._execute_writes([(self, "update", data)])
+
+    async def delete(self):
+        self._client._execute_writes([(self, "delete", None)])
+
+    async def get(self, field_paths=None, transaction=None):
+        return SQLiteSnapshot(self, self._read())
+
+
+class SQLiteCollection(SQLiteQuery):
+    def __init__(self, client, path):
+        self._client_ref = client
+        self._path = tuple(path)
+        self.id = self._path[-1]
+        self._key = "/".join(self._path)
+        super().__init__(self)
+
+    @property
+    def _client(self):
+        return self._client_ref
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = uuid.uuid4().hex
+        return SQLiteDocument(self._client, self._path + (doc_id,))
+
+
+class SQLiteWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append((reference, "merge" if merge else "set", dict(document_data)))
+
+    def update(self, reference, field_updates):
+        self._ops.append((reference, "update", dict(field_updates)))
+
+    def delete(self, reference):
+        self._ops.append((reference, "delete", None))
+
+    async def commit(self):
+        ops, self._ops = self._ops, []
+        self._client._execute_writes(ops)
+
+
+class SQLiteTransaction(SQLiteWriteBatch):
+    """Staged writes applied by ``SQLiteFirestore.run_transaction``."""
+
+
+class SQLiteFirestore:
+    """Async Firestore-compatible client backed by a SQLite database file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, cached_statements=512
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        for fields in INDEXED_FIELDS:
+            name = "idx_documents_" + "_".join(fields)
+            columns = ", ".join(_extract(f) for f in fields)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON documents (collection, {columns})")
+        # Refresh planner statistics so the expression indexes get used.
+        self._conn.execute("PRAGMA optimize")
+        self._transaction_lock = asyncio.Lock()
+
+    def collection(self, name):
+        return SQLiteCollection(self, (name,))
+
+    def document(self, path):
+        return SQLiteDocument(self, tuple(path.split("/")))
+
+    def batch(self):
+        return SQLiteWriteBatch(self)
+
+    def transaction(self):
+        return SQLiteTransaction(self)
+
+    def _execute_writes(self, ops):
+        """Apply ``(reference, op, data)`` writes in one SQLite transaction."""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for reference, op, data in ops:
+                conn.execute(*reference._write_sql(op, data))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    async def run_transaction(self, callback):
+        async with self._transaction_lock:
+            transaction = self.transaction()
+            result = await callback(transaction)
+            await transaction.commit()
+            return result
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references:
+            yield await ref.get()
+
+    def explain(self, query):
+        """Return SQLite's ``EXPLAIN QUERY PLAN`` rows for ``query``."""
+        sql, params = query._select_sql("doc_id, data")
+        return [row[-1] for row in self._conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+    def close(self):
+        self._conn.execute("PRAGMA optimize")
+        self._conn.close()
+
+
+__all__ = ["SQLiteFirestore"]
@@ -0,0 +1,106 @@
+"""Per-render cost of quote HTML/PDF generation, before and after template caching.
+
+Run from the repository root:
+
+    python benchmarks/pdf_templates.py [--renders N]
+
+"before" rebuilds the HTML with the old f-string builder and lets WeasyPrint
+parse a fresh stylesheet and font configuration on every render; "after"
+uses the compiled Jinja templates and the per-process stylesheet and font
+caches used by the PDF workers. PDF timings are skipped when WeasyPrint is
+not installed.
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pdf_utils  # noqa: E402
+
+
+QUOTE = {
+    "quote_number": "DEV-2025-0042",
+    "client_name": "Atelier Dupont & Fils",
+    "items": [
+        {"description": f"Prestation {i}", "quantity": 2.0, "unit_price": 75.0, "total": 150.0}
+        for i in range(20)
+    ],
+    "subtotal": 3000.0,
+    "tax_rate": 20.0,
+    "tax_amount": 600.0,
+    "total": 3600.0,
+}
+
+
+def legacy_quote_html(quote: dict) -> str:
+    items = "".join(
+        f"<tr><td>{item['description']}</td><td>{item['quantity']}</td><td>{item['unit_price']}</td><td>{item['total']}</td></tr>"
+        for item in quote.get('items', [])
+    )
+    return f"""
+    <html>
+    <head><meta charset='utf-8'><title>Quote {quote.get('quote_number')}</title></head>
+    <body>
+    <h1>Quote {quote.get('quote_number')}</h1>
+    <p>Client: {quote.get('client_name')}</p>
+    <table border='1' cellspacing='0' cellpadding='4'>
+    <tr><th>Description</th><th>Qty</th><th>Unit Price</th><th>Total</th></tr>
+    {items}
+    </table>
+    <p>Subtotal: {quote.get('subtotal')}</p>
+    <p>Tax ({quote.get('tax_rate')}%): {quote.get('tax_amount')}</p>
+    <p>Total: {quote.get('total')}</p>
+    </body></html>
+    """
+
+
+def uncached_template_html(quote: dict) -> str:
+    # What rendering would cost if templates were loaded and compiled per call.
+    environment = pdf_utils.Environment(
+        loader=pdf_utils.FileSystemLoader(pdf_utils.TEMPLATE_DIR),
+        autoescape=pdf_utils.select_autoescape(["html"]),
+    )
+    environment.filters["money"] = pdf_utils._money
+    return environment.get_template("quote.html").render(doc=quote)
+
+
+def report(label: str, fn, renders: int):
+    fn()
+    seconds = timeit.timeit(fn, number=renders) / renders
+    print(f"{label:<44} {seconds * 1e3:9.3f} ms/render")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=200)
+    args = parser.parse_args()
+
+    print("HTML generation")
+    report("before: f-string builder", lambda: legacy_quote_html(QUOTE), args.renders * 10)
+    report("uncached: compile template per render", lambda: uncached_template_html(QUOTE), args.renders)
+    report("after: compiled, cached template", lambda: pdf_utils.render_html("quote", QUOTE), args.renders * 10)
+
+    try:
+        from weasyprint import CSS, HTML
+    except ImportError:
+        print("\nWeasyPrint is not installed; skipping PDF rendering.")
+        return
+
+    stylesheet = Path(pdf_utils.stylesheets()[0]).read_text()
+    pdf_renders = max(1, args.renders // 10)
+
+    def before():
+        HTML(string=legacy_quote_html(QUOTE)).write_pdf(stylesheets=[CSS(string=stylesheet)])
+
+    def after():
+        pdf_utils._render_pdf(pdf_utils.render_html("quote", QUOTE), pdf_utils.stylesheets())
+
+    print("\nPDF rendering")
+    report("before: parse stylesheet and fonts per render", before, pdf_renders)
+    report("after: cached stylesheet and font config", after, pdf_renders)
+
+
+if __name__ == "__main__":
+    main()
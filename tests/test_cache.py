@@ -0,0 +1,32 @@
+import time
+
+from cache import LRUCache
+
+
+def test_lru_eviction_and_stats():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_entry_ttl_expires():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("token", {"uid": "u1"}, ttl=0.01)
+    assert cache.get("token") == {"uid": "u1"}
+    time.sleep(0.02)
+    assert cache.get("token") is None
+
+
+def test_non_positive_ttl_is_not_stored():
+    cache = LRUCache(maxsize=10)
+    cache.set("expired", 1, ttl=-5)
+    assert len(cache) == 0
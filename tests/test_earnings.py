@@ -0,0 +1,84 @@
+import random
+
+from earnings import (
+    DEFAULT_HOURLY_RATE,
+    earnings_totals,
+    parse_minutes,
+    parse_minutes_array,
+    scalar_totals,
+    slot_minutes,
+)
+
+
+TIMES = ["09:00", "9:30", "17:45", "00:00", "24:00", "23:59:59", "25:00", "09:60", "", "9", "ab:cd", None]
+
+
+def test_parse_minutes_scalar_and_vector_agree():
+    values = [t for t in TIMES if t is not None]
+    expected = [parse_minutes(v) for v in values]
+    assert expected[:6] == [540, 570, 1065, 0, 1440, 1439]
+    assert expected[6:] == [None] * 5
+    assert parse_minutes_array(values).tolist() == [-1 if m is None else m for m in expected]
+
+
+def test_minute_precision_and_midnight_crossing():
+    assert slot_minutes("09:15", "10:45") == 90
+    assert slot_minutes("22:00", "02:00") == 240
+    assert slot_minutes("00:00", "24:00") == 1440
+    assert slot_minutes("09:00", "bad") is None
+
+    events = [{"status": "unpaid", "start_time": "09:15", "end_time": "10:45", "hourly_rate": 40.0}]
+    tasks = [{"price": 30.0, "time_slots": [{"start": "08:00", "end": "08:20"}, {"start": "x", "end": "09:00"}]}]
+    totals = earnings_totals(events, tasks)[None]
+    assert totals["amounts"]["unpaid"] == 60.0
+    assert totals["amounts"]["paid"] == 10.0
+    assert totals["hours"]["unpaid"] == 1.5
+
+
+def test_missing_or_null_hourly_rate_uses_the_default():
+    events = [
+        {"status": "paid", "start_time": "09:00", "end_time": "10:00", "hourly_rate": None},
+        {"status": "paid", "start_time": "10:00", "end_time": "11:00"},
+        {"status": "unpaid", "start_time": "11:00", "end_time": "12:00", "hourly_rate": 0},
+    ]
+    totals = earnings_totals(events, [])[None]
+    assert totals == scalar_totals(events, [])[None]
+    assert totals["amounts"]["paid"] == 2 * DEFAULT_HOURLY_RATE
+    assert totals["amounts"]["unpaid"] == 0.0
+
+
+def _random_time(rng):
+    if rng.random() < 0.05:
+        return rng.choice(TIMES)
+    return f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+
+
+def test_vectorized_totals_match_scalar_reference():
+    rng = random.Random(7)
+    statuses = ["paid", "unpaid", "pending", "not_worked", "cancelled"]
+    events = [
+        {
+            "week": rng.randrange(1, 53),
+            "status": rng.choice(statuses),
+            "start_time": _random_time(rng),
+            "end_time": _random_time(rng),
+            "hourly_rate": rng.choice([35.0, 50.0, 72.5, 0.1]),
+        }
+        for _ in range(3000)
+    ]
+    tasks = [
+        {
+            "week": rng.randrange(1, 53),
+            "price": rng.choice([10.0, 12.3, 99.99]),
+            "time_slots": [
+                {"start": _random_time(rng), "end": _random_time(rng)} for _ in range(rng.randrange(4))
+            ],
+        }
+        for _ in range(1000)
+    ]
+
+    def key(doc):
+        return doc["week"]
+
+    assert earnings_totals(events, tasks, key=key) == scalar_totals(events, tasks, key=key)
+    assert earnings_totals([], []) == scalar_totals([], []) == {}
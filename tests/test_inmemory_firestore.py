@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from memory_store import InMemoryFirestore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _ids(query):
+    return [snap.id async for snap in query.stream()]
+
+
+async def _seed(db):
+    col = db.collection("events")
+    docs = [
+        {"id": "a", "year": 2024, "week": 1, "status": "paid", "total": 10},
+        {"id": "b", "year": 2024, "week": 2, "status": "unpaid", "total": 20},
+        {"id": "c", "year": 2024, "week": 2, "status": "pending", "total": 30},
+        {"id": "d", "year": 2025, "week": 2, "status": "paid", "total": 40},
+        {"id": "e", "year": 2024, "status": "paid", "total": 50},
+    ]
+    for doc in docs:
+        await col.document(doc["id"]).set(doc)
+    return col
+
+
+def test_equality_and_in_filters():
+    async def scenario():
+        col = await _seed(InMemoryFirestore())
+        assert await _ids(col.where("year", "==", 2024).where("week", "==", 2)) == ["b", "c"]
+        assert await _ids(col.where("status", "in", ["paid", "pending"])) == ["a", "c", "d", "e"]
+        assert await _ids(col.where("status", "not-in", ["paid"])) == ["b", "c"]
+    run(scenario())
+
+
+def test_range_filters_order_and_limit():
+    async def scenario():
+        col = await _seed(InMemoryFirestore())
+        query = col.where("total", ">", 10).where("total", "<=", 40)
+        assert await _ids(query) == ["b", "c", "d"]
+        ordered = col.order_by("week", direction="DESCENDING").order_by("total").limit(3)
+        assert await _ids(ordered) == ["b", "c", "d"]
+    run(scenario())
+
+
+def test_indexes_follow_writes():
+    async def scenario():
+        col = await _seed(InMemoryFirestore())
+        assert await _ids(col.where("week", "==", 2)) == ["b", "c", "d"]
+        await col.document("b").update({"week": 3})
+        await col.document("c").delete()
+        await col.document("f").set({"id": "f", "week": 2})
+        assert await _ids(col.where("week", "==", 2)) == ["d", "f"]
+        assert await _ids(col.where("week", ">=", 3)) == ["b"]
+    run(scenario())
+
+
+def test_aggregation_respects_filters():
+    async def scenario():
+        col = await _seed(InMemoryFirestore())
+        rows = await col.where("status", "==", "paid").count(alias="count").sum("total", alias="total").get()
+        values = {result.alias: result.value for result in rows[0]}
+        assert values == {"count": 3, "total": 100}
+    run(scenario())
+
+
+def test_subcollections_are_isolated_per_document():
+    async def scenario():
+        db = InMemoryFirestore()
+        await db.collection("users").document("u1").set({"uid": "u1"})
+        await db.collection("users").document("u1").collection("events").document("e1").set({"id": "e1"})
+        await db.collection("users").document("u2").collection("events").document("e2").set({"id": "e2"})
+        assert await _ids(db.collection("users")) == ["u1"]
+        assert await _ids(db.collection("users").document("u1").collection("events")) == ["e1"]
+        await db.collection("users").document("u1").delete()
+        assert await _ids(db.collection("users").document("u1").collection("events")) == ["e1"]
+    run(scenario())
+
+
+def test_snapshot_views_copy_on_write():
+    async def scenario():
+        db = InMemoryFirestore()
+        ref = db.collection("clients").document("c1")
+        await ref.set({"name": "Acme"})
+        view = (await ref.get()).to_dict()
+        view["name"] = "Changed"
+        assert view["name"] == "Changed"
+        assert (await ref.get()).to_dict()["name"] == "Acme"
+    run(scenario())
+
+
+def test_failed_batch_is_not_applied():
+    async def scenario():
+        db = InMemoryFirestore()
+        batch = db.batch()
+        batch.set(db.collection("quotes").document("q1"), {"id": "q1"})
+        batch.update(db.collection("quotes").document("missing"), {"status": "sent"})
+        with pytest.raises(KeyError):
+            await batch.commit()
+        assert not (await db.collection("quotes").document("q1").get()).exists
+    run(scenario())
+
+
+def test_persistent_store_survives_restart(tmp_path):
+    from memory_store import PersistentInMemoryFirestore
+
+    async def write(db):
+        await db.collection("users").document("u1").collection("todos").document("t1").set({"id": "t1"})
+        await db.collection("users").document("u1").collection("todos").document("t2").set({"id": "t2"})
+        await db.collection("users").document("u1").collection("todos").document("t1").delete()
+
+    async def read(db):
+        return await _ids(db.collection("users").document("u1").collection("todos"))
+
+    db = PersistentInMemoryFirestore(tmp_path, compact_every=2)
+    run(write(db))
+    db._wal.close()
+    assert run(read(PersistentInMemoryFirestore(tmp_path))) == ["t2"]
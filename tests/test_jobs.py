@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from jobs import JobError, JobQueue
+from memory_store import InMemoryFirestore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def transact(client, callback):
+    return await client.run_transaction(callback)
+
+
+async def wait_for_status(queue, job_id, statuses, timeout=2.0):
+    async def poll():
+        while True:
+            job = await queue.get(job_id)
+            if job["status"] in statuses:
+                return job
+            await asyncio.sleep(0.01)
+    return await asyncio.wait_for(poll(), timeout)
+
+
+def test_job_succeeds_and_stores_result():
+    async def scenario():
+        queue = JobQueue(InMemoryFirestore(), transact)
+
+        async def double(job):
+            return {"value": job["params"]["n"] * 2}
+
+        queue.register("double", double)
+        job = await queue.submit("double", {"n": 21}, owner="u1")
+        done = await wait_for_status(queue, job["id"], ("succeeded",))
+        assert done["result"] == {"value": 42}
+        assert done["attempts"] == 1
+        with pytest.raises(JobError):
+            await queue.submit("missing", {}, owner="u1")
+    run(scenario())
+
+
+def test_failed_attempts_are_retried_with_backoff():
+    async def scenario():
+        queue = JobQueue(InMemoryFirestore(), transact)
+        calls = []
+
+        async def flaky(job):
+            calls.append(job["attempts"])
+            if len(calls) < 3:
+                raise RuntimeError("boom")
+            return "ok"
+
+        async def broken(job):
+            raise RuntimeError("always")
+
+        queue.register("flaky", flaky, max_attempts=3, backoff=0.01)
+        queue.register("broken", broken, max_attempts=2, backoff=0.01)
+        flaky_job = await queue.submit("flaky", {}, owner="u1")
+        broken_job = await queue.submit("broken", {}, owner="u1")
+        assert (await wait_for_status(queue, flaky_job["id"], ("succeeded",)))["result"] == "ok"
+        assert calls == [1, 2, 3]
+        failed = await wait_for_status(queue, broken_job["id"], ("failed",))
+        assert failed["error"] == "always"
+        assert failed["attempts"] == 2
+    run(scenario())
+
+
+def test_cancel_running_job_and_per_type_concurrency():
+    async def scenario():
+        queue = JobQueue(InMemoryFirestore(), transact)
+        running = []
+
+        async def slow(job):
+            running.append(job["id"])
+            await asyncio.sleep(10)
+
+        queue.register("slow", slow, concurrency=1)
+        first = await queue.submit("slow", {}, owner="u1")
+        second = await queue.submit("slow", {}, owner="u1")
+        await wait_for_status(queue, first["id"], ("running",))
+        await asyncio.sleep(0.05)
+        assert running == [first["id"]]
+        assert (await queue.get(second["id"]))["status"] == "queued"
+
+        assert (await queue.cancel(first["id"]))["status"] == "cancelled"
+        await wait_for_status(queue, second["id"], ("running",))
+        await queue.cancel(second["id"])
+        await asyncio.sleep(0.01)
+        assert (await queue.get(first["id"]))["status"] == "cancelled"
+    run(scenario())
+
+
+def test_interrupted_jobs_are_recovered_after_restart():
+    async def scenario():
+        db = InMemoryFirestore()
+        started = asyncio.Event()
+
+        async def slow(job):
+            started.set()
+            await asyncio.sleep(10)
+
+        old = JobQueue(db, transact)
+        old.register("export", slow)
+        job = await old.submit("export", {}, owner="u1")
+        await started.wait()
+        await old.stop()
+        assert (await old.get(job["id"]))["status"] == "queued"
+
+        new = JobQueue(db, transact)
+
+        async def quick(job):
+            return "done"
+
+        new.register("export", quick)
+        new.start()
+        done = await wait_for_status(new, job["id"], ("succeeded",))
+        assert done["result"] == "done"
+        assert done["attempts"] == 1
+        await new.stop()
+    run(scenario())
+
+
+def test_results_are_shared_between_instances_and_purged():
+    async def scenario():
+        db = InMemoryFirestore()
+        worker = JobQueue(db, transact, retention=3600)
+        payload = bytes(range(256)) * 5000
+
+        async def export(job):
+            async def chunks():
+                for i in range(0, len(payload), 100_000):
+                    yield payload[i:i + 100_000]
+            return await worker.store_result(job["id"], chunks())
+
+        worker.register("export", export)
+        job = await worker.submit("export", {}, owner="u1")
+        result = (await wait_for_status(worker, job["id"], ("succeeded",)))["result"]
+        assert result == {"chunks": 3, "size": len(payload)}
+
+        # Another instance serves the result from the shared database.
+        other = JobQueue(db, transact, retention=3600)
+        assert await other.has_result(job["id"], result["chunks"])
+        assert b"".join([c async for c in other.read_result(job["id"], result["chunks"])]) == payload
+
+        assert await other.purge() == 0
+        other.retention = 0
+        assert await other.purge() == 1
+        assert await other.get(job["id"]) is None
+        assert not await other.has_result(job["id"], result["chunks"])
+    run(scenario())
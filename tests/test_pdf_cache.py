@@ -0,0 +1,63 @@
+import asyncio
+
+import pdf_utils
+from pdf_utils import PDFCache
+
+
+def test_content_addressed_keys():
+    quote = {"quote_number": "DEV-2025-0001", "items": [{"description": "Design", "total": 100.0}]}
+    assert PDFCache.key("quote", quote) == PDFCache.key("quote", dict(reversed(list(quote.items()))))
+    assert PDFCache.key("quote", quote) != PDFCache.key("invoice", quote)
+    assert PDFCache.key("quote", quote) != PDFCache.key("quote", {**quote, "total": 1.0})
+
+
+def test_size_bounded_lru_eviction(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    assert cache.get("a") == tmp_path / "a.pdf"
+    cache.put("c", b"x" * 10)
+    assert cache.get("b") is None
+    assert not (tmp_path / "b.pdf").exists()
+    assert cache.get("a").read_bytes() == b"x" * 10
+    assert cache.stats()["bytes"] == 20
+
+
+def test_reloads_existing_files(tmp_path):
+    PDFCache(tmp_path).put("k", b"%PDF")
+    cache = PDFCache(tmp_path)
+    assert cache.get("k").read_bytes() == b"%PDF"
+    assert cache.stats()["evictions"] == 0
+
+
+class SlowRenderer:
+    def __init__(self):
+        self.calls = 0
+
+    async def render(self, html, stylesheet_paths=()):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return b"%PDF shared"
+
+
+def test_shared_render_survives_the_first_caller_leaving(tmp_path, monkeypatch):
+    renderer = SlowRenderer()
+    monkeypatch.setattr(pdf_utils, "pdf_renderer", renderer)
+    monkeypatch.setattr(pdf_utils, "pdf_cache", PDFCache(tmp_path))
+    monkeypatch.setattr(pdf_utils, "render_html", lambda kind, document, team_id=None: "<p>quote</p>")
+
+    async def scenario():
+        quote = {"quote_number": "DEV-2025-0001"}
+        first = asyncio.create_task(pdf_utils.cached_pdf("quote", quote))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(pdf_utils.cached_pdf("quote", quote))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        _, path = await second
+        assert first.cancelled()
+        return path
+
+    path = asyncio.run(scenario())
+    assert path.read_bytes() == b"%PDF shared"
+    assert renderer.calls == 1
+    assert not pdf_utils._inflight
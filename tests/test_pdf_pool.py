@@ -0,0 +1,62 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from pdf_utils import PDFRenderBusy, PDFRenderPool, PDFRenderTimeout
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def stub_pool(**kwargs):
+    # Stub renders are plain stdlib functions, so workers skip the WeasyPrint warm-up.
+    return PDFRenderPool(initializer=None, **{"workers": 1, "timeout": 10.0, **kwargs})
+
+
+def test_renders_beyond_the_queue_limit_are_rejected():
+    async def scenario():
+        pool = stub_pool(max_queue=2)
+        try:
+            queued = [asyncio.create_task(pool.run(time.sleep, 0.5)) for _ in range(2)]
+            await asyncio.sleep(0)
+            assert pool.pending == 2
+            with pytest.raises(PDFRenderBusy):
+                await pool.run(os.getpid)
+            await asyncio.gather(*queued)
+            assert pool.pending == 0
+            assert await pool.run(os.getpid) > 0
+        finally:
+            pool.close()
+    run(scenario())
+
+
+def test_timeout_discards_and_replaces_the_pool():
+    async def scenario():
+        pool = stub_pool(timeout=0.5)
+        try:
+            stuck_pid = await pool.run(os.getpid)
+            first = pool._executor
+            with pytest.raises(PDFRenderTimeout):
+                await pool.run(time.sleep, 30)
+            assert pool._executor is None
+            assert await pool.run(os.getpid) != stuck_pid
+            assert pool._executor is not first
+        finally:
+            pool.close()
+    run(scenario())
+
+
+def test_workers_are_recycled_after_renders_per_worker():
+    async def scenario():
+        pool = stub_pool(renders_per_worker=2)
+        try:
+            pids = [await pool.run(os.getpid) for _ in range(4)]
+        finally:
+            pool.close()
+        assert pids[0] == pids[1]
+        assert pids[2] == pids[3]
+        assert pids[1] != pids[2]
+    run(scenario())
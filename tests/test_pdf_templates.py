@@ -0,0 +1,29 @@
+from pdf_utils import render_html, stylesheets
+
+
+QUOTE = {
+    "quote_number": "DEV-2025-0001",
+    "client_name": "Dupont & Fils",
+    "items": [{"description": "<b>Design</b>", "quantity": 2, "unit_price": 50, "total": 100}],
+    "subtotal": 100,
+    "tax_rate": 20,
+    "tax_amount": 20,
+    "total": 120,
+}
+
+
+def test_values_are_escaped():
+    html = render_html("quote", QUOTE)
+    assert "<title>Quote DEV-2025-0001</title>" in html
+    assert "Dupont &amp; Fils" in html
+    assert "&lt;b&gt;Design&lt;/b&gt;" in html
+    assert "<b>Design</b>" not in html
+    assert "120.00" in html
+
+
+def test_unknown_or_unsafe_team_falls_back_to_default_template():
+    default = render_html("invoice", {"invoice_number": "FAC-1", "items": []})
+    assert render_html("invoice", {"invoice_number": "FAC-1", "items": []}, "no-such-team") == default
+    assert render_html("invoice", {"invoice_number": "FAC-1", "items": []}, "../..") == default
+    assert stylesheets("../..") == stylesheets()
+    assert stylesheets()[0].endswith("pdf.css")
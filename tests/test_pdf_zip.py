@@ -0,0 +1,72 @@
+import asyncio
+import io
+import zipfile
+
+import pdf_utils
+from pdf_utils import PDFRenderError, stream_pdf_zip
+
+
+async def archive_bytes(documents, entry_name=lambda doc: doc["number"]):
+    return b"".join([chunk async for chunk in stream_pdf_zip("invoice", documents, entry_name, concurrency=2)])
+
+
+def fake_renderer(tmp_path, failures=None):
+    failures = failures or {}
+
+    async def cached_pdf(kind, document, team_id=None):
+        await asyncio.sleep(0)
+        if document["number"] in failures:
+            raise failures[document["number"]]
+        path = tmp_path / f"{document['number']}.pdf"
+        path.write_bytes(f"%PDF {document['number']}".encode())
+        return document["number"], path
+
+    return cached_pdf
+
+
+async def listing(documents, error=None):
+    for document in documents:
+        yield document
+    if error:
+        raise error
+
+
+def test_streamed_archive_contains_every_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_utils, "cached_pdf", fake_renderer(tmp_path))
+    documents = [{"number": f"FACT-{i}"} for i in range(5)]
+    data = asyncio.run(archive_bytes(listing(documents)))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [f"FACT-{i}.pdf" for i in range(5)]
+        assert archive.read("FACT-3.pdf") == b"%PDF FACT-3"
+
+
+def test_failures_are_listed_and_the_archive_is_still_closed(tmp_path, monkeypatch):
+    failures = {"FACT-1": PDFRenderError("renderer down"), "FACT-2": ValueError("bad template data")}
+    monkeypatch.setattr(pdf_utils, "cached_pdf", fake_renderer(tmp_path, failures))
+    documents = [{"number": f"FACT-{i}"} for i in range(4)] + [{"id": "no-number"}]
+    data = asyncio.run(archive_bytes(listing(documents, RuntimeError("query aborted"))))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == ["FACT-0.pdf", "FACT-3.pdf", "errors.txt"]
+        errors = archive.read("errors.txt").decode().splitlines()
+    assert sorted(errors) == sorted([
+        "FACT-1.pdf: renderer down",
+        "FACT-2.pdf: bad template data",
+        "no-number: 'number'",
+        "Listing stopped early: query aborted",
+    ])
+
+
+def test_a_render_cancelled_elsewhere_is_reported(tmp_path, monkeypatch):
+    failures = {"DEV-1": asyncio.CancelledError()}
+    monkeypatch.setattr(pdf_utils, "cached_pdf", fake_renderer(tmp_path, failures))
+    documents = [{"number": "DEV-1"}, {"number": "DEV-2"}]
+    data = asyncio.run(archive_bytes(listing(documents)))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == ["DEV-2.pdf", "errors.txt"]
+        assert archive.read("errors.txt") == b"DEV-1.pdf: rendering was cancelled\n"
@@ -0,0 +1,206 @@
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("firebase_admin")
+
+from fastapi.testclient import TestClient
+
+import server
+from memory_store import InMemoryFirestore
+
+
+AUTH = {"Authorization": "Bearer test-token"}
+EVENT = {
+    "description": "Workshop",
+    "client_id": "c1",
+    "client_name": "Acme",
+    "day": "monday",
+    "start_time": "09:00",
+    "end_time": "11:00",
+    "status": "paid",
+    "hourly_rate": 40.0,
+}
+QUOTE = {
+    "client_id": "c1",
+    "client_name": "Acme",
+    "title": "Website",
+    "items": [{"description": "Design", "quantity": 2, "unit_price": 100.0}],
+    "valid_until": "2026-12-31T00:00:00",
+}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, "db", InMemoryFirestore())
+    monkeypatch.setattr(server.firebase_auth, "verify_id_token", lambda token, check_revoked=False: {"uid": "u1"})
+    for cache in (server.token_cache, server.profile_cache, server.week_cache, server.team_roster_cache):
+        cache.clear()
+    api = TestClient(server.app)
+    api.get("/api/auth/me", headers=AUTH)
+    return api
+
+
+def test_documents_created_before_a_team_stay_editable(client):
+    event = client.post("/api/planning/events", headers=AUTH, json=EVENT).json()
+    quote = client.post("/api/quotes", headers=AUTH, json=QUOTE).json()
+    team_id = client.post("/api/teams", headers=AUTH, json={"name": "Team"}).json()["team_id"]
+
+    response = client.put(f"/api/planning/events/{event['id']}", headers=AUTH, json={**EVENT, "end_time": "12:00"})
+    assert response.status_code == 200
+    response = client.put(f"/api/quotes/{quote['id']}/status", headers=AUTH, params={"status": "sent"})
+    assert response.status_code == 200
+
+    team_events = run(server.stream_docs(server.team_col(team_id, "events")))
+    team_quotes = run(server.stream_docs(server.team_col(team_id, "quotes")))
+    assert [e["end_time"] for e in team_events] == ["12:00"]
+    assert [(q["status"], q["total"]) for q in team_quotes] == [("sent", quote["total"])]
+
+    # The team rollup counts the event once, from the update onwards.
+    earnings = client.get(f"/api/planning/earnings/{event['year']}/{event['week']}", headers=AUTH, params={"team_id": team_id})
+    assert earnings.json()["paid"] == 120.0
+
+
+def test_week_cache_notices_writes_from_other_instances(client):
+    event = client.post("/api/planning/events", headers=AUTH, json=EVENT).json()
+    url = f"/api/planning/week/{event['year']}/{event['week']}"
+    assert len(client.get(url, headers=AUTH).json()["events"]) == 1
+
+    # Another instance writes without touching this process's week cache.
+    other = {**event, "id": "other-event"}
+    run(server.write_planning("u1", None, "events", "set", other["id"], other))
+
+    assert len(client.get(url, headers=AUTH).json()["events"]) == 2
+
+
+def test_dashboard_etag_never_labels_a_stale_profile(client):
+    invoices_etag = client.get("/api/invoices", headers=AUTH).headers["ETag"]
+    # The first load builds the revenue summary without invalidating any ETag.
+    first = client.get("/api/dashboard", headers=AUTH)
+    etag = first.headers["ETag"]
+    assert client.get("/api/dashboard", headers={**AUTH, "If-None-Match": etag}).status_code == 304
+    assert client.get("/api/invoices", headers={**AUTH, "If-None-Match": invoices_etag}).status_code == 304
+
+    # Another instance changes the profile; this process still caches the old one.
+    client.get("/api/teams/my", headers=AUTH)
+    run(server.user_doc("u1").update({"hourly_rate": 75.0}))
+    run(server.bump_versions(("users", "u1"), "profile"))
+
+    second = client.get("/api/dashboard", headers={**AUTH, "If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.json()["user"]["hourly_rate"] == 75.0
+    assert client.get("/api/dashboard", headers={**AUTH, "If-None-Match": second.headers["ETag"]}).status_code == 304
+
+
+def live_buckets(summary):
+    return {
+        name: {status: (b["count"], round(b["total"], 6)) for status, b in summary[name].items() if b["count"]}
+        for name in ("invoices", "quotes")
+    }
+
+
+def test_revenue_summary_deltas_match_a_rebuild(client):
+    client.post("/api/revenue/rebuild", headers=AUTH)
+    invoice = {**QUOTE, "due_date": "2026-12-31T00:00:00"}
+    invoice.pop("valid_until")
+    quotes = [client.post("/api/quotes", headers=AUTH, json=QUOTE).json() for _ in range(3)]
+    invoices = [client.post("/api/invoices", headers=AUTH, json=invoice).json() for _ in range(3)]
+
+    for quote_id, status in [(quotes[0]["id"], "sent"), (quotes[1]["id"], "accepted"), (quotes[0]["id"], "rejected")]:
+        client.put(f"/api/quotes/{quote_id}/status", headers=AUTH, params={"status": status})
+    for invoice_id, status in [(invoices[0]["id"], "sent"), (invoices[0]["id"], "paid"), (invoices[1]["id"], "paid"),
+                               (invoices[1]["id"], "sent"), (invoices[2]["id"], "overdue")]:
+        client.put(f"/api/invoices/{invoice_id}/status", headers=AUTH, params={"status": status})
+    bigger = {**invoice, "items": [{"description": "Build", "quantity": 3, "unit_price": 250.0}]}
+    client.put(f"/api/invoices/{invoices[2]['id']}", headers=AUTH, json=bigger)
+    client.put(f"/api/quotes/{quotes[1]['id']}", headers=AUTH, json={**QUOTE, "tax_rate": 5.5})
+    client.delete(f"/api/quotes/{quotes[2]['id']}", headers=AUTH)
+    client.delete(f"/api/invoices/{invoices[0]['id']}", headers=AUTH)
+
+    incremental = run(server.load_revenue_summary("u1"))
+    rebuilt = run(server.rebuild_revenue_summary("u1"))
+    assert live_buckets(incremental) == live_buckets(rebuilt)
+    assert server.revenue_totals(incremental) == pytest.approx(server.revenue_totals(rebuilt))
+    assert server.revenue_totals(rebuilt)["paid"] == 0
+    assert server.revenue_totals(rebuilt)["unpaid_invoices_count"] == 2
+
+
+def rollup_amounts(scope, year, week):
+    rollup = run(server.load_week_rollup(scope, year, week))
+    return {field: {s: round(v, 6) for s, v in rollup[field].items()} for field in ("amounts", "hours")}
+
+
+def test_incremental_rollups_match_a_backfill(client):
+    scope = ("users", "u1")
+    event = client.post("/api/planning/events", headers=AUTH, json=EVENT).json()
+    year, week = event["year"], event["week"]
+    task = {"name": "Admin", "price": 30.0, "color": "blue", "icon": "x",
+            "time_slots": [{"day": "tuesday", "start": "08:00", "end": "08:45"}]}
+    task = client.post("/api/planning/tasks", headers=AUTH, json=task).json()
+    second = client.post("/api/planning/events", headers=AUTH, json={**EVENT, "status": "pending"}).json()
+
+    client.put(f"/api/planning/events/{event['id']}", headers=AUTH, json={**EVENT, "status": "unpaid", "end_time": "12:30"})
+    run(server.write_planning("u1", None, "events", "update", second["id"], {"year": year + 1, "week": 2}))
+    client.delete(f"/api/planning/tasks/{task['id']}", headers=AUTH)
+    moved = [(year, week), (year + 1, 2)]
+    incremental = [rollup_amounts(scope, y, w) for y, w in moved]
+
+    run(server.backfill_earnings_rollups(scope))
+    assert [rollup_amounts(scope, y, w) for y, w in moved] == incremental
+    assert incremental[0]["amounts"]["unpaid"] == 140.0
+    assert incremental[1]["amounts"]["pending"] == 80.0
+
+
+def test_backfill_resets_rollups_without_source_documents(client):
+    scope = ("users", "u1")
+    event = client.post("/api/planning/events", headers=AUTH, json=EVENT).json()
+    year, week = event["year"], event["week"]
+    stale = server.empty_rollup(year - 1, 10)
+    stale["amounts"]["paid"] = 999.0
+    run(server.rollup_ref(scope, year - 1, 10).set(stale))
+
+    assert run(server.backfill_earnings_rollups(scope)) == 1
+    assert rollup_amounts(scope, year - 1, 10)["amounts"]["paid"] == 0
+    assert rollup_amounts(scope, year, week)["amounts"]["paid"] == 80.0
+
+
+def test_planning_dates_around_new_year():
+    # Created on 2025-12-29: calendar year 2025, but ISO week 1 of 2026.
+    legacy = {"year": 2025, "week": 1, "created_at": datetime(2025, 12, 29, 9)}
+    assert server.planning_date(legacy, "monday") == date(2025, 12, 29)
+    assert server.planning_date({"year": 2025, "week": 1, "iso_year": 2026}, "friday") == date(2026, 1, 2)
+    assert server.planning_date({"year": 2025, "week": 1}, "monday") == date(2024, 12, 30)
+    # 2021 has no week 53: 2021-01-01 is in week 53 of 2020.
+    assert server.planning_date({"year": 2021, "week": 53}, "friday") == date(2021, 1, 1)
+    assert server.planning_date({"year": 2021, "week": 53, "created_at": datetime(2021, 1, 2)}, "friday") == date(2021, 1, 1)
+    assert server.planning_date({"year": 2020, "week": 53}, "monday") == date(2020, 12, 28)
+
+    assert server.planning_years(date(2026, 3, 1), date(2026, 6, 30)) == [2026]
+    assert server.planning_years(date(2026, 1, 1), date(2026, 1, 31)) == [2025, 2026]
+    assert server.planning_years(date(2025, 12, 30), date(2025, 12, 31)) == [2025, 2026]
+
+
+def test_earnings_range_places_new_year_weeks_on_their_dates(client):
+    december = {**EVENT, "id": "dec", "uid": "u1", "year": 2025, "week": 1, "created_at": datetime(2025, 12, 29)}
+    january = {**EVENT, "id": "jan", "uid": "u1", "year": 2021, "week": 53, "day": "friday", "hourly_rate": 10.0}
+    for doc in (december, january):
+        run(server.write_planning("u1", None, "events", "set", doc["id"], doc))
+
+    body = client.get("/api/planning/earnings/range", headers=AUTH, params={"from": "2025-12-29", "to": "2025-12-31"}).json()
+    assert body["totals"]["amounts"]["paid"] == 80.0
+    assert [b["key"] for b in body["buckets"]] == ["2026-W01"]
+
+    body = client.get("/api/planning/earnings/range", headers=AUTH, params={"from": "2021-01-01", "to": "2021-01-01"}).json()
+    assert body["totals"]["amounts"]["paid"] == 20.0
+    assert [b["key"] for b in body["buckets"]] == ["2020-W53"]
+
+
+def test_new_planning_entries_store_their_iso_year(client):
+    event = client.post("/api/planning/events", headers=AUTH, json=EVENT).json()
+    assert (event["iso_year"], event["week"]) == tuple(datetime.now().isocalendar()[:2])
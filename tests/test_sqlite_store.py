@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+
+from sqlite_store import SQLiteFirestore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _ids(query):
+    return [snap.id async for snap in query.stream()]
+
+
+def _events(db):
+    return db.collection("users").document("u1").collection("events")
+
+
+async def _seed(db):
+    batch = db.batch()
+    for i in range(6):
+        batch.set(_events(db).document(f"e{i}"), {
+            "id": f"e{i}",
+            "year": 2024,
+            "week": i % 3,
+            "status": "paid" if i % 2 else "pending",
+            "total": 10 * i,
+            "created_at": datetime(2024, 1, 1 + i),
+        })
+    await batch.commit()
+
+
+def test_filters_order_and_cursor():
+    async def scenario():
+        db = SQLiteFirestore(":memory:")
+        await _seed(db)
+        assert await _ids(_events(db).where("year", "==", 2024).where("week", "==", 1)) == ["e1", "e4"]
+        ordered = _events(db).order_by("created_at", direction="DESCENDING").order_by("id", direction="DESCENDING")
+        assert await _ids(ordered.limit(2)) == ["e5", "e4"]
+        page = ordered.start_after({"created_at": datetime(2024, 1, 5), "id": "e4"}).limit(2)
+        assert await _ids(page) == ["e3", "e2"]
+    run(scenario())
+
+
+def test_round_trip_and_aggregation():
+    async def scenario():
+        db = SQLiteFirestore(":memory:")
+        await _seed(db)
+        await _events(db).document("e1").update({"status": "pending"})
+        snap = await _events(db).document("e2").get()
+        assert snap.to_dict()["created_at"] == datetime(2024, 1, 3)
+        await _events(db).document("e3").update({"attachment": b"%PDF\x00\xff"})
+        assert (await _events(db).document("e3").get()).to_dict()["attachment"] == b"%PDF\x00\xff"
+        rows = await _events(db).where("status", "==", "paid").count(alias="count").sum("total", alias="total").get()
+        assert {r.alias: r.value for r in rows[0]} == {"count": 2, "total": 80}
+    run(scenario())
+
+
+def test_failed_batch_rolls_back():
+    async def scenario():
+        db = SQLiteFirestore(":memory:")
+        batch = db.batch()
+        batch.set(_events(db).document("a"), {"id": "a"})
+        batch.update(_events(db).document("missing"), {"status": "paid"})
+        try:
+            await batch.commit()
+        except KeyError:
+            pass
+        assert not (await _events(db).document("a").get()).exists
+    run(scenario())